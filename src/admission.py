@@ -0,0 +1,177 @@
+"""Допуск вопросов к RAG: лимит на чат, ограниченная очередь и честная очередность.
+
+Каждый чат получает вопросы по маркерному ведру (ADMISSION_CHAT_RATE
+вопросов в секунду, запас ADMISSION_CHAT_BURST). Одновременно
+обрабатывается не больше ADMISSION_CONCURRENCY вопросов, остальные ждут
+в общей очереди длиной до ADMISSION_QUEUE_SIZE. Освободившееся место
+отдаётся чатам по кругу: чат с десятью вопросами в очереди не задерживает
+чат с одним. Если очередь полна или место не освободилось за
+ADMISSION_MAX_WAIT секунд, вопрос сразу отклоняется — бот отвечает
+«занят», а не ждёт таймаута.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from config import (
+    ADMISSION_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT, ADMISSION_CHAT_RATE, ADMISSION_CHAT_BURST
+)
+from metrics import STAGE_SECONDS, ADMISSION_QUEUE_DEPTH, ADMISSION_ACTIVE, ADMISSION_REJECTED
+
+# Ведра чатов, простоявших до полного запаса, удаляются при таком их числе
+BUCKET_PRUNE_THRESHOLD = 10000
+
+
+class AdmissionError(RuntimeError):
+    """Вопрос не допущен к обработке"""
+
+
+class RateLimitedError(AdmissionError):
+    """Чат превысил лимит вопросов"""
+
+
+class OverloadedError(AdmissionError):
+    """Очередь полна или место не освободилось вовремя"""
+
+
+class _Ticket:
+    def __init__(self, chat_id, on_grant):
+        self.chat_id = chat_id
+        self.on_grant = on_grant
+        self.created = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(self, concurrency: int = ADMISSION_CONCURRENCY, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 max_wait: float = ADMISSION_MAX_WAIT, chat_rate: float = ADMISSION_CHAT_RATE,
+                 chat_burst: float = ADMISSION_CHAT_BURST):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        # chat_id -> очередь билетов; порядок ключей — порядок обхода по кругу
+        self._waiting = OrderedDict()
+        # chat_id -> [маркеры, время последнего пополнения]
+        self._buckets = {}
+
+    def _take_token(self, chat_id, now: float) -> bool:
+        if self.chat_rate <= 0:
+            return True
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= BUCKET_PRUNE_THRESHOLD:
+                self._prune_buckets(now)
+            bucket = self._buckets[chat_id] = [self.chat_burst, now]
+        bucket[0] = min(self.chat_burst, bucket[0] + (now - bucket[1]) * self.chat_rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _prune_buckets(self, now: float):
+        self._buckets = {
+            chat_id: bucket for chat_id, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.chat_rate < self.chat_burst
+        }
+
+    def _update_gauges(self):
+        ADMISSION_QUEUE_DEPTH.set(self._queued)
+        ADMISSION_ACTIVE.set(self._active)
+
+    def submit(self, chat_id, on_grant):
+        """Ставит вопрос в очередь; on_grant вызывается, когда для него освободилось место.
+
+        Если место есть сразу, on_grant вызывается до возврата. Возвращает
+        билет для cancel(). RateLimitedError и OverloadedError — вопрос не принят.
+        """
+        with self._lock:
+            if not self._take_token(chat_id, time.monotonic()):
+                ADMISSION_REJECTED.inc(reason="rate_limited")
+                raise RateLimitedError("Слишком много вопросов из чата")
+            ticket = _Ticket(chat_id, on_grant)
+            grant = self._active < self.concurrency and not self._queued
+            if grant:
+                self._active += 1
+            elif self._queued >= self.queue_size:
+                ADMISSION_REJECTED.inc(reason="queue_full")
+                raise OverloadedError("Очередь вопросов заполнена")
+            else:
+                self._waiting.setdefault(chat_id, deque()).append(ticket)
+                self._queued += 1
+            self._update_gauges()
+        if grant:
+            STAGE_SECONDS.observe(0.0, stage="admission_wait")
+            on_grant()
+        return ticket
+
+    def cancel(self, ticket) -> bool:
+        """Убирает билет из очереди. False — место уже выдано, его нужно освободить release()"""
+        with self._lock:
+            tickets = self._waiting.get(ticket.chat_id)
+            if not tickets or ticket not in tickets:
+                return False
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[ticket.chat_id]
+            self._queued -= 1
+            self._update_gauges()
+        ADMISSION_REJECTED.inc(reason="wait_timeout")
+        return True
+
+    def release(self):
+        """Освобождает место и отдаёт его следующему чату по кругу"""
+        with self._lock:
+            ticket = None
+            if self._waiting:
+                chat_id, tickets = next(iter(self._waiting.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    self._waiting.move_to_end(chat_id)
+                else:
+                    del self._waiting[chat_id]
+                self._queued -= 1
+            else:
+                self._active -= 1
+            self._update_gauges()
+        if ticket is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - ticket.created, stage="admission_wait")
+            ticket.on_grant()
+
+    @contextmanager
+    def slot(self, chat_id):
+        """Блокирующий допуск для потоков: ждёт места не дольше max_wait"""
+        granted = threading.Event()
+        ticket = self.submit(chat_id, granted.set)
+        if not granted.wait(self.max_wait) and self.cancel(ticket):
+            raise OverloadedError("Место в очереди не освободилось вовремя")
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, chat_id):
+        """Асинхронный допуск: ждёт места, не занимая поток. После работы — release()"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def on_grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        ticket = self.submit(chat_id, on_grant)
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+        except asyncio.TimeoutError:
+            if self.cancel(ticket):
+                raise OverloadedError("Место в очереди не освободилось вовремя")
+        except asyncio.CancelledError:
+            # Выданное место никто не использует — возвращаем его
+            if not self.cancel(ticket):
+                self.release()
+            raise
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES
+from single_flight import normalize_question
+
+
+def index_fingerprint(index_path: str) -> str:
+    """Отпечаток векторного индекса: меняется при каждой пересборке файлов в index_path"""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(index_path)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{os.path.relpath(os.path.join(root, name), index_path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """Кеш ответов по эмбеддингу вопроса.
+
+    Вопрос считается повтором, если косинусная близость его эмбеддинга
+    к сохранённому не меньше threshold. Хранится не больше max_entries
+    ответов, при переполнении вытесняется давно не использованный.
+    Кроме того, ответы хранятся по нормализованному тексту вопроса
+    (lookup_text): точный повтор находится без эмбеддинга, а ответы,
+    построенные без эмбеддинга (быстрый лексический путь), тоже
+    попадают в кеш. Записи лежат в SQLite и загружаются при старте; если отпечаток
+    индекса изменился (индекс пересобран), кеш очищается.
+    """
+
+    def __init__(self, fingerprint: str, db_path: str = ANSWER_CACHE_PATH,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS exact_answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            if row is not None:
+                print("Индекс пересобран, кеш ответов очищен")
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM exact_answers")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        self._conn.commit()
+
+        # Нормированные векторы держим в памяти одной матрицей
+        rows = self._conn.execute("SELECT id, answer, vector, last_used FROM answers").fetchall()
+        self._ids = [row[0] for row in rows]
+        self._answers = [row[1] for row in rows]
+        self._last_used = [row[3] for row in rows]
+        self._vectors = np.array([np.frombuffer(row[2], dtype=np.float32) for row in rows], dtype=np.float32)
+        # нормализованный вопрос -> [ответ, время последнего использования]
+        self._exact = {
+            key: [answer, last_used]
+            for key, answer, last_used in self._conn.execute("SELECT key, answer, last_used FROM exact_answers")
+        }
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector):
+        """Возвращает сохранённый ответ на похожий вопрос или None"""
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._ids:
+                return None
+            scores = self._vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._last_used[best] = time.time()
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (self._last_used[best], self._ids[best]))
+            self._conn.commit()
+            return self._answers[best]
+
+    def lookup_text(self, question: str):
+        """Ответ на тот же вопрос с точностью до регистра и знаков препинания или None"""
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is None:
+                return None
+            entry[1] = time.time()
+            self._conn.execute("UPDATE exact_answers SET last_used = ? WHERE key = ?", (entry[1], key))
+            self._conn.commit()
+            return entry[0]
+
+    def _store_text(self, question: str, answer: str, now: float):
+        key = normalize_question(question)
+        if key not in self._exact and len(self._exact) >= self.max_entries:
+            oldest = min(self._exact, key=lambda k: self._exact[k][1])
+            del self._exact[oldest]
+            self._conn.execute("DELETE FROM exact_answers WHERE key = ?", (oldest,))
+        self._exact[key] = [answer, now]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO exact_answers (key, answer, last_used) VALUES (?, ?, ?)", (key, answer, now)
+        )
+
+    def store(self, question: str, vector, answer: str):
+        """Сохраняет ответ; без vector — только по тексту вопроса"""
+        now = time.time()
+        with self._lock:
+            self._store_text(question, answer, now)
+            if vector is None:
+                self._conn.commit()
+                return
+            vector = self._normalize(vector)
+            if len(self._ids) >= self.max_entries:
+                oldest = int(np.argmin(self._last_used))
+                self._conn.execute("DELETE FROM answers WHERE id = ?", (self._ids[oldest],))
+                del self._ids[oldest], self._answers[oldest], self._last_used[oldest]
+                self._vectors = np.delete(self._vectors, oldest, axis=0)
+            cursor = self._conn.execute(
+                "INSERT INTO answers (question, answer, vector, last_used) VALUES (?, ?, ?, ?)",
+                (question, answer, vector.tobytes(), now)
+            )
+            self._conn.commit()
+            self._ids.append(cursor.lastrowid)
+            self._answers.append(answer)
+            self._last_used.append(now)
+            self._vectors = np.vstack([self._vectors.reshape(-1, len(vector)), vector])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
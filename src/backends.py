@@ -0,0 +1,153 @@
+"""Бэкенды эмбеддингов и чат-модели.
+
+openai — API OpenAI (по умолчанию через ProxyAPI, адрес меняется
+OPENAI_BASE_URL, в том числе на локальный fake_openai_server.py).
+hashing / fake — детерминированные локальные заменители без сети и
+ключей: на них можно строить индекс, искать и гонять бота офлайн.
+"""
+import hashlib
+import math
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from lexical_index import tokenize
+from config import (
+    OPENAI_BASE_URL, EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_CTX_CHECK, HASHING_EMBED_DIM,
+    LLM_BACKEND, FAKE_LLM_LATENCY, FAKE_LLM_TOKEN_DELAY
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """Эмбеддинги хешированием признаков: термы текста (как у BM25) и
+    символьные триграммы раскладываются по dim координатам со знаком.
+
+    Векторы нормированы, близкие по словам тексты получают близкие
+    векторы, а результат зависит только от текста.
+    """
+
+    def __init__(self, dim: int = HASHING_EMBED_DIM):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        terms = tokenize(text)
+        features = Counter(terms)
+        for term in terms:
+            padded = f" {term} "
+            features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed_text(self, text) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        # Токены вместо текста (так присылает OpenAIEmbeddings с проверкой длины) хешируются как термы
+        features = Counter(map(str, text)) if isinstance(text, list) else self._features(text)
+        for feature, count in features.items():
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign * (1 + math.log(count))
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts) -> list:
+        return [self.embed_text(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_text(text)
+
+
+_SOURCE_RE = re.compile(r"ИСТОЧНИК: (?:Книга: (?P<book>[^|]+) \| )?Глава: (?P<chapter>[^|]+) \| Страница: (?:Страница )?(?P<page>\S+)")
+
+
+def extractive_answer(prompt: str) -> str:
+    """Ответ без модели: цитата из первого фрагмента контекста и блок источников.
+
+    Формат как у настоящего ответа, чтобы длина и разметка были правдоподобными.
+    """
+    context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+    sources = list(_SOURCE_RE.finditer(context))
+    if not sources:
+        return ("I cannot answer that question because the provided context "
+                "does not contain relevant information.")
+    first = context[sources[0].end():].strip().split("\n---", 1)[0]
+    quote = " ".join(first.split()[:40])
+    pages = {}
+    for match in sources:
+        pages.setdefault(match.group("chapter").strip(), set()).add(match.group("page"))
+    lines = [f"В книге об этом сказано так: «{quote}»", "", "Источники:"]
+    for chapter, chapter_pages in pages.items():
+        ordered = sorted(chapter_pages, key=lambda page: (not page.isdigit(), int(page) if page.isdigit() else page))
+        lines.append(f"[{chapter}, {', '.join(ordered)}]")
+    return "\n".join(lines)
+
+
+def split_tokens(text: str):
+    """Текст кусками по слову с пробелами, как приходят токены при стриминге"""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Чат-модель без сети: извлекающий ответ из контекста промпта.
+
+    latency — задержка до первого токена, token_delay — между токенами;
+    поддерживает stream(), поэтому годится для замеров потокового ответа.
+    """
+
+    latency: float = FAKE_LLM_LATENCY
+    token_delay: float = FAKE_LLM_TOKEN_DELAY
+    model_name: str = "fake-extractive"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-extractive"
+
+    def _answer(self, messages) -> str:
+        return extractive_answer("\n".join(str(message.content) for message in messages))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        answer = self._answer(messages)
+        time.sleep(self.latency + self.token_delay * len(split_tokens(answer)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, token in enumerate(split_tokens(self._answer(messages))):
+            if i:
+                time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def create_embeddings(backend: str = EMBEDDING_BACKEND):
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        from http_transport import get_http_client
+        # Повторы делает общий транспорт, у SDK они выключены
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL, base_url=OPENAI_BASE_URL,
+                                check_embedding_ctx_length=EMBEDDING_CTX_CHECK,
+                                http_client=get_http_client(), max_retries=0)
+    if backend == "hashing":
+        return HashingEmbeddings()
+    raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}. Доступны: openai, hashing")
+
+
+def create_llm(model_name: str, backend: str = LLM_BACKEND):
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+        from http_transport import get_http_client
+        return ChatOpenAI(temperature=0, model_name=model_name, base_url=OPENAI_BASE_URL,
+                          http_client=get_http_client(), max_retries=0)
+    if backend == "fake":
+        return FakeChatModel()
+    raise ValueError(f"Неизвестный бэкенд LLM: {backend}. Доступны: openai, fake")
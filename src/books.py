@@ -1,3 +1,6 @@
+import re
+from bisect import bisect_right
+
 BOOK_METADATA = {
     "История философии.pdf": {
         "chapters": [
@@ -9,80 +12,127 @@ BOOK_METADATA = {
             {
                 "title": "Глава 1. Понятие досократической философии, ее место в истории античной философии",
                 "start_page": 27,
-                "end_page": 44
+                "end_page": 44,
+                "keywords": ["досократ"]
             },
             {
                 "title": "Глава 2. Обзор основных философских позиций досократического периода",
                 "start_page": 45,
-                "end_page": 89
+                "end_page": 89,
+                "keywords": ["досократ", "милетск", "фалес", "анаксимандр", "анаксимен", "гераклит", "пифагор", "элейск", "парменид", "эмпедокл", "анаксагор", "демокрит", "атомизм", "атомист"]
             },
             {
                 "title": "Глава 3. Античная софистика",
                 "start_page": 90,
-                "end_page": 103
+                "end_page": 103,
+                "keywords": ["софист", "протагор", "горги"]
             },
             {
                 "title": "Глава 4. Сократ и сократические школы",
                 "start_page": 107,
-                "end_page": 122
+                "end_page": 122,
+                "keywords": ["сократ", "киник", "киренаик", "мегарск"]
             },
             {
                 "title": "Глава 5. Платон и Академия",
                 "start_page": 124,
-                "end_page": 153
+                "end_page": 153,
+                "keywords": ["платон", "академи"]
             },
             {
                 "title": "Глава 6. Аристотель и Ликей",
                 "start_page": 154,
-                "end_page": 196
+                "end_page": 196,
+                "keywords": ["аристотел", "ликей", "перипатет"]
             },
             {
                 "title": "Глава 7. Стоицизм",
                 "start_page": 201,
-                "end_page": 213
+                "end_page": 213,
+                "keywords": ["стоик", "стоиц", "зенон китийск", "хрисипп"]
             },
             {
                 "title": "Глава 8. Эпикуреизм",
                 "start_page": 214,
-                "end_page": 223
+                "end_page": 223,
+                "keywords": ["эпикур"]
             },
             {
                 "title": "Глава 9. Скептицизм",
                 "start_page": 225,
-                "end_page": 231
+                "end_page": 231,
+                "keywords": ["скептик", "скептиц", "пиррон", "секст эмпирик"]
             },
             {
                 "title": "Глава 10. Средний платонизм",
                 "start_page": 232,
-                "end_page": 239
+                "end_page": 239,
+                "keywords": ["средн\\w* платон"]
             },
             {
                 "title": "Глава 11. Философия в Риме",
                 "start_page": 240,
-                "end_page": 252
+                "end_page": 252,
+                "keywords": ["рим\\b", "римск", "сенек", "цицерон", "лукреци", "марк аврели"]
             },
             {
                 "title": "Глава 12. Неоплатонизм",
                 "start_page": 253,
-                "end_page": 270
+                "end_page": 270,
+                "keywords": ["неоплатон", "плотин", "порфири", "прокл", "ямвлих"]
             },
             {
                 "title": "Глава 13. Влияние античной философии на средневековую мысль",
                 "start_page": 272,
-                "end_page": 286
+                "end_page": 286,
+                "keywords": ["средневеков", "схоласт"]
             }
         ]
     }
 }
 
+class ChapterIndex:
+    """Отсортированные интервалы страниц глав: глава по странице ищется бинарным поиском"""
+
+    def __init__(self, chapters):
+        chapters = sorted(chapters, key=lambda chapter: chapter["start_page"])
+        self._starts = [chapter["start_page"] for chapter in chapters]
+        self._ends = [chapter["end_page"] for chapter in chapters]
+        self._titles = [chapter["title"] for chapter in chapters]
+
+    def __len__(self):
+        return len(self._titles)
+
+    def find(self, page_number):
+        """Название главы, в интервал которой попадает страница, или None"""
+        i = bisect_right(self._starts, page_number) - 1
+        if i >= 0 and page_number <= self._ends[i]:
+            return self._titles[i]
+        return None
+
+
+# Индексы строятся один раз при импорте
+CHAPTER_INDEXES = {
+    book_name: ChapterIndex(book_info.get("chapters", []))
+    for book_name, book_info in BOOK_METADATA.items()
+}
+
+# Ключевые слова глав: совпадение ищется с начала слова в вопросе
+CHAPTER_KEYWORDS = [
+    (re.compile(r"\b" + keyword, re.IGNORECASE), chapter["title"])
+    for book_info in BOOK_METADATA.values()
+    for chapter in book_info.get("chapters", [])
+    for keyword in chapter.get("keywords", [])
+]
+
 def find_chapter_for_page(book_name, page_number):
     """Определяет главу по номеру страницы для указанной книги"""
-    book_info = BOOK_METADATA.get(book_name, {})
-    chapters = book_info.get("chapters", [])
+    chapter_index = CHAPTER_INDEXES.get(book_name)
     
-    if chapters:
-        for chapter in chapters:
-            if chapter["start_page"] <= page_number <= chapter["end_page"]:
-                return chapter["title"]
-        return "Введение"  # По умолчанию
-    return "Неизвестная глава"  # Если глав нет или книга не найдена 
\ No newline at end of file
+    if chapter_index:
+        return chapter_index.find(page_number) or "Введение"  # По умолчанию
+    return "Неизвестная глава"  # Если глав нет или книга не найдена
+
+def detect_chapters(question):
+    """Главы, к которым явно относится вопрос (по ключевым словам), например «стоики» -> Глава 7"""
+    return sorted({title for pattern, title in CHAPTER_KEYWORDS if pattern.search(question)}) 
\ No newline at end of file
@@ -1,37 +1,324 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import telebot
-from config import TELEGRAM_TOKEN
+from telebot.util import smart_split, MAX_MESSAGE_LENGTH
+from config import (
+    TELEGRAM_TOKEN, TELEGRAM_API_URL, BOT_MAX_WORKERS, REQUEST_TIMEOUT, STREAM_RESPONSES, STREAM_EDIT_INTERVAL
+)
+from metrics import span, ERRORS
+from startup import NotReadyError
+from admission import AdmissionError, RateLimitedError
+
+WELCOME_TEXT = """👋 Здравствуйте! Я бот-ассистент по книге "История философии".
+            
+            🤖 Я могу ответить на ваши вопросы о содержании книги, используя технологию RAG (Retrieval-Augmented Generation).
+            
+            📚 Просто задайте мне вопрос о книге, и я постараюсь найти релевантную информацию и предоставить вам точный ответ.
+            
+            ❗️ Важно: Я отвечаю только на основе содержания книги по античной философии и не использую внешние источники информации."""
+NOT_TEXT_MESSAGE = 'Я работаю только с текстовыми сообщениями!'
+TIMEOUT_MESSAGE = 'Не удалось подготовить ответ вовремя. Попробуйте задать вопрос ещё раз.'
+WARMING_UP_MESSAGE = '⏳ Я только что запустился и загружаю книгу. Задайте вопрос через минуту.'
+BUSY_MESSAGE = '🚦 Сейчас слишком много вопросов. Попробуйте ещё раз через минуту.'
+RATE_LIMITED_MESSAGE = '✋ Вы задаёте вопросы слишком часто. Подождите немного и спросите снова.'
+NOT_TEXT_CONTENT_TYPES = ['audio', 'video', 'document', 'photo', 'sticker', 'voice', 'location', 'contact']
+def use_api_url(helper):
+    """Направляет запросы к Bot API на TELEGRAM_API_URL (например, локальный тестовый сервер)"""
+    if TELEGRAM_API_URL:
+        helper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+
+
+def error_reply(error: Exception) -> str:
+    """Ошибка обработки вопроса: попадает в журнал и метрики, пользователю — короткий текст"""
+    ERRORS.inc(stage="bot")
+    print(f"Ошибка обработки вопроса: {error!r}")
+    return f"Произошла ошибка: {str(error)}"
+
+
+def admission_reply(error: AdmissionError) -> str:
+    return RATE_LIMITED_MESSAGE if isinstance(error, RateLimitedError) else BUSY_MESSAGE
+
+
+# Признак того, что ответ ещё пишется
+DRAFT_SUFFIX = ' …'
+
+
+def draft_text(text: str) -> str:
+    """Промежуточный текст ответа: влезает в одно сообщение Telegram"""
+    return text[:MAX_MESSAGE_LENGTH - len(DRAFT_SUFFIX)] + DRAFT_SUFFIX
+
+
+class StreamingReply:
+    """Ответ, который пишется потоком в одно сообщение Telegram (синхронный бот).
+
+    Первое сообщение отправляется с первым фрагментом ответа, дальше оно
+    редактируется не чаще раза в interval секунд. finish() ставит полный
+    ответ; если он длиннее лимита Telegram, хвост уходит отдельными сообщениями.
+    """
+
+    def __init__(self, bot, message, interval: float = STREAM_EDIT_INTERVAL):
+        self.bot = bot
+        self.message = message
+        self.interval = interval
+        self.text = ""
+        self.sent = None
+        self.shown = None
+        self.last_edit = 0.0
+
+    def _show(self, text):
+        if text == self.shown:
+            return
+        try:
+            with span("telegram_send"):
+                if self.sent is None:
+                    self.sent = self.bot.reply_to(self.message, text)
+                else:
+                    self.bot.edit_message_text(text, self.sent.chat.id, self.sent.message_id)
+            self.shown = text
+        except Exception as e:
+            print(f"Не удалось обновить сообщение: {e}")
+        self.last_edit = time.monotonic()
+
+    def push(self, chunk: str):
+        self.text += chunk
+        if self.sent is None or time.monotonic() - self.last_edit >= self.interval:
+            self._show(draft_text(self.text))
+
+    def finish(self, answer: str):
+        parts = smart_split(answer, MAX_MESSAGE_LENGTH) or [answer]
+        self._show(parts[0])
+        for part in parts[1:]:
+            with span("telegram_send"):
+                self.bot.send_message(self.message.chat.id, part)
+
+
+class AsyncStreamingReply:
+    """То же для асинхронного бота.
+
+    push() вызывается из потока, где идёт генерация, и только передаёт
+    фрагмент в цикл событий; правки сообщения делает отдельная задача.
+    """
+
+    def __init__(self, bot, message, interval: float = STREAM_EDIT_INTERVAL, on_first_token=None):
+        self.bot = bot
+        self.message = message
+        self.interval = interval
+        self.on_first_token = on_first_token
+        self.text = ""
+        self.sent = None
+        self.shown = None
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._edit_loop())
+
+    def push(self, chunk: str):
+        self._loop.call_soon_threadsafe(self._append, chunk)
+
+    def _append(self, chunk):
+        if self._closed:
+            return
+        if not self.text and self.on_first_token is not None:
+            self.on_first_token()
+        self.text += chunk
+        self._changed.set()
+
+    async def _show(self, text):
+        if text == self.shown:
+            return
+        try:
+            with span("telegram_send"):
+                if self.sent is None:
+                    self.sent = await self.bot.reply_to(self.message, text)
+                else:
+                    await self.bot.edit_message_text(text, self.sent.chat.id, self.sent.message_id)
+            self.shown = text
+        except Exception as e:
+            print(f"Не удалось обновить сообщение: {e}")
+
+    async def _edit_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            await self._show(draft_text(self.text))
+            await asyncio.sleep(self.interval)
+
+    async def finish(self, answer: str):
+        # Фрагменты, пришедшие после ответа (например, после таймаута), не показываются
+        self._closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        parts = smart_split(answer, MAX_MESSAGE_LENGTH) or [answer]
+        await self._show(parts[0])
+        for part in parts[1:]:
+            with span("telegram_send"):
+                await self.bot.send_message(self.message.chat.id, part)
 
 class RAGBot:
-    def __init__(self, rag_system):
+    def __init__(self, rag_system, stream: bool = STREAM_RESPONSES, admission=None):
+        use_api_url(telebot.apihelper)
         self.bot = telebot.TeleBot(TELEGRAM_TOKEN)
         self.rag_system = rag_system
+        self.stream = stream
+        # AdmissionController: лимиты на чат и общая очередь перед RAG
+        self.admission = admission
         self._setup_handlers()
+
+    def get_answer(self, message, on_token=None) -> str:
+        if self.admission is None:
+            return self.rag_system.get_answer(message.text, message.chat.id, on_token=on_token)
+        with self.admission.slot(message.chat.id):
+            return self.rag_system.get_answer(message.text, message.chat.id, on_token=on_token)
         
     def _setup_handlers(self):
         @self.bot.message_handler(commands=['start'])
         def send_welcome(message):
-            welcome_text = """👋 Здравствуйте! Я бот-ассистент по книге "История философии".
-            
-            🤖 Я могу ответить на ваши вопросы о содержании книги, используя технологию RAG (Retrieval-Augmented Generation).
-            
-            📚 Просто задайте мне вопрос о книге, и я постараюсь найти релевантную информацию и предоставить вам точный ответ.
-            
-            ❗️ Важно: Я отвечаю только на основе содержания книги по античной философии и не использую внешние источники информации."""
-            self.bot.reply_to(message, welcome_text)
+            self.bot.reply_to(message, WELCOME_TEXT)
             
         @self.bot.message_handler(func=lambda message: True)
         def handle_message(message):
-            try:
-                answer = self.rag_system.get_answer(message.text)
-                self.bot.reply_to(message, answer)
-            except Exception as e:
-                error_message = f"Произошла ошибка: {str(e)}"
-                self.bot.reply_to(message, error_message)
+            with span("bot_request"):
+                if self.stream:
+                    reply = StreamingReply(self.bot, message)
+                    try:
+                        answer = self.get_answer(message, on_token=reply.push)
+                    except NotReadyError:
+                        answer = WARMING_UP_MESSAGE
+                    except AdmissionError as e:
+                        answer = admission_reply(e)
+                    except Exception as e:
+                        answer = error_reply(e)
+                    reply.finish(answer)
+                    return
+                try:
+                    answer = self.get_answer(message)
+                except NotReadyError:
+                    answer = WARMING_UP_MESSAGE
+                except AdmissionError as e:
+                    answer = admission_reply(e)
+                except Exception as e:
+                    answer = error_reply(e)
+                with span("telegram_send"):
+                    self.bot.reply_to(message, answer)
                 
-        @self.bot.message_handler(content_types=['audio', 'video', 'document', 'photo', 'sticker', 'voice', 'location', 'contact'])
+        @self.bot.message_handler(content_types=NOT_TEXT_CONTENT_TYPES)
         def not_text(message):
-            self.bot.send_message(message.chat.id, 'Я работаю только с текстовыми сообщениями!')
+            self.bot.send_message(message.chat.id, NOT_TEXT_MESSAGE)
     
     def start(self):
         print("Бот запущен...")
-        self.bot.polling(none_stop=True) 
\ No newline at end of file
+        self.bot.polling(none_stop=True) 
+
+
+class AsyncRAGBot:
+    """Асинхронный бот: вопросы разных чатов обрабатываются параллельно.
+
+    Блокирующий get_answer выполняется в ограниченном пуле потоков,
+    каждый запрос ограничен по времени REQUEST_TIMEOUT. С admission
+    вопросы проходят лимиты чата и общую очередь (см. admission.py). В режиме stream
+    ответ показывается по мере генерации правками одного сообщения.
+    """
+
+    # Статус "печатает" в Telegram гаснет через ~5 секунд
+    TYPING_INTERVAL = 4
+
+    def __init__(self, rag_system, max_workers: int = BOT_MAX_WORKERS, request_timeout: float = REQUEST_TIMEOUT,
+                 stream: bool = STREAM_RESPONSES, admission=None):
+        # aiohttp нужен только асинхронному боту: импорт не замедляет старт синхронного
+        from telebot import asyncio_helper
+        from telebot.async_telebot import AsyncTeleBot
+        use_api_url(asyncio_helper)
+        self.bot = AsyncTeleBot(TELEGRAM_TOKEN)
+        self.rag_system = rag_system
+        self.request_timeout = request_timeout
+        self.stream = stream
+        self.admission = admission
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-worker")
+        self._setup_handlers()
+
+    def _setup_handlers(self):
+        @self.bot.message_handler(commands=['start'])
+        async def send_welcome(message):
+            await self.bot.reply_to(message, WELCOME_TEXT)
+
+        @self.bot.message_handler(func=lambda message: True)
+        async def handle_message(message):
+            await self.handle_message(message)
+
+        @self.bot.message_handler(content_types=NOT_TEXT_CONTENT_TYPES)
+        async def not_text(message):
+            await self.bot.send_message(message.chat.id, NOT_TEXT_MESSAGE)
+
+    async def _keep_typing(self, chat_id):
+        while True:
+            try:
+                await self.bot.send_chat_action(chat_id, 'typing')
+            except Exception as e:
+                print(f"Не удалось отправить статус набора: {e}")
+            await asyncio.sleep(self.TYPING_INTERVAL)
+
+    async def answer(self, question: str, chat_id=None, on_token=None) -> str:
+        """Выполняет get_answer в пуле потоков с ограничением по времени.
+
+        С admission вопрос сначала ждёт места в очереди допуска, не занимая поток.
+        """
+        if self.admission is not None:
+            await self.admission.acquire(chat_id)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, partial(self.rag_system.get_answer, question, chat_id, on_token=on_token)
+        )
+        if self.admission is not None:
+            # Место освобождается, когда поток закончил работу, а не по таймауту ожидания
+            future.add_done_callback(lambda _: self.admission.release())
+            future = asyncio.shield(future)
+        return await asyncio.wait_for(future, timeout=self.request_timeout)
+
+    async def handle_message(self, message):
+        with span("bot_request"):
+            await self._handle_message(message)
+
+    async def _handle_message(self, message):
+        # Сразу показываем пользователю, что вопрос принят
+        typing_task = asyncio.create_task(self._keep_typing(message.chat.id))
+        reply = None
+        if self.stream:
+            # С первым фрагментом ответа появляется сообщение, статус "печатает" больше не нужен
+            reply = AsyncStreamingReply(self.bot, message, on_first_token=typing_task.cancel)
+        try:
+            answer = await self.answer(message.text, message.chat.id, reply.push if reply else None)
+        except asyncio.TimeoutError:
+            ERRORS.inc(stage="timeout")
+            answer = TIMEOUT_MESSAGE
+        except NotReadyError:
+            answer = WARMING_UP_MESSAGE
+        except AdmissionError as e:
+            answer = admission_reply(e)
+        except Exception as e:
+            answer = error_reply(e)
+        finally:
+            typing_task.cancel()
+        if reply is not None:
+            await reply.finish(answer)
+        else:
+            with span("telegram_send"):
+                await self.bot.reply_to(message, answer)
+
+    async def _run(self):
+        try:
+            await self.bot.infinity_polling()
+        finally:
+            await self.bot.close_session()
+
+    def start(self):
+        print("Асинхронный бот запущен...")
+        try:
+            asyncio.run(self._run())
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
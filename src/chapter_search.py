@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+import faiss
+import numpy as np
+
+from chunk_store import IdentityIdMapping
+
+
+def search_parameters(index, selector):
+    """Параметры поиска с фильтром id под конкретный тип индекса FAISS.
+
+    Переданные параметры заменяют настройки индекса, поэтому efSearch и nprobe копируются.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+class ChapterFilteredStore:
+    """Векторное хранилище с поиском внутри выбранных глав.
+
+    При создании для каждой главы один раз собирается массив позиций
+    её чанков в индексе FAISS. Поиск по главам передаёт в FAISS
+    IDSelectorBatch, поэтому сравниваются только чанки этих глав.
+    Остальные атрибуты и методы берутся у исходного хранилища.
+    """
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        if hasattr(vectorstore.docstore, "chapter_positions"):
+            # Хранилище чанков на диске отдаёт главы без чтения текстов
+            positions = vectorstore.docstore.chapter_positions()
+        else:
+            positions = defaultdict(list)
+            for position, docstore_id in vectorstore.index_to_docstore_id.items():
+                doc = vectorstore.docstore.search(docstore_id)
+                positions[doc.metadata.get("chapter")].append(position)
+        self.chapter_ids = {
+            chapter: np.array(sorted(ids), dtype=np.int64) for chapter, ids in positions.items()
+        }
+        # id в docstore -> позиция в индексе, для хранилищ без IdentityIdMapping
+        self._docstore_positions = None
+
+    def __getattr__(self, name):
+        return getattr(self.vectorstore, name)
+
+    @property
+    def chapters(self):
+        return list(self.chapter_ids)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, chapters=None, **kwargs):
+        """Как у FAISS; с chapters поиск идёт только по чанкам этих глав"""
+        if not chapters:
+            return self.vectorstore.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+        ids = [self.chapter_ids[chapter] for chapter in chapters if chapter in self.chapter_ids]
+        if not ids:
+            return []
+        ids = np.concatenate(ids)
+        vector = np.array([embedding], dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(vector)
+        params = search_parameters(self.vectorstore.index, faiss.IDSelectorBatch(ids))
+        scores, indices = self.vectorstore.index.search(vector, min(k, len(ids)), params=params)
+        results = []
+        for score, i in zip(scores[0], indices[0]):
+            if i == -1:
+                continue
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i])
+            results.append((doc, float(score)))
+        return results
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, chapters=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, chapters, **kwargs)]
+
+    def lexical_search_with_score(self, query: str, k: int = 4, chapters=None):
+        """BM25 по чанкам хранилища (если оно его поддерживает), с тем же фильтром по главам"""
+        docstore = self.vectorstore.docstore
+        if not hasattr(docstore, "lexical_search"):
+            return []
+        positions = None
+        if chapters:
+            ids = [self.chapter_ids[chapter] for chapter in chapters if chapter in self.chapter_ids]
+            if not ids:
+                return []
+            positions = np.concatenate(ids)
+        return docstore.lexical_search(query, k, positions)
+
+    def _positions(self, docs):
+        """Позиции документов в индексе FAISS; None, если какую-то не найти"""
+        mapping = self.vectorstore.index_to_docstore_id
+        if isinstance(mapping, IdentityIdMapping):
+            return [int(doc.id) for doc in docs]
+        # В обычном хранилище LangChain id документа — UUID из docstore
+        if self._docstore_positions is None or len(self._docstore_positions) != len(mapping):
+            self._docstore_positions = {docstore_id: position for position, docstore_id in mapping.items()}
+        positions = [self._docstore_positions.get(doc.id) for doc in docs]
+        return None if None in positions else positions
+
+    def embeddings_for(self, docs):
+        """Векторы найденных документов; None, если их не достать (тогда MMR пропускается)"""
+        positions = self._positions(docs)
+        if positions is None:
+            return None
+        docstore = self.vectorstore.docstore
+        vectors = docstore.vectors(positions) if hasattr(docstore, "vectors") else None
+        if vectors is None:
+            try:
+                vectors = np.array([self.vectorstore.index.reconstruct(position) for position in positions],
+                                   dtype=np.float32)
+            except RuntimeError:
+                # IVF без direct map не восстанавливает векторы по позиции
+                return None
+        return vectors
@@ -0,0 +1,212 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_manifest import VECTORS_FILE
+from lexical_index import tokenize, bm25_search
+
+CHUNKS_FILE = "chunks.sqlite"
+# 2 — добавлен инвертированный индекс BM25
+CHUNK_STORE_VERSION = 2
+READ_ONLY_MESSAGE = (
+    "Индекс открыт через mmap и хранилище чанков только для чтения: "
+    "add_texts/delete не поддерживаются, пересоберите индекс через DocumentProcessor.process_pdf"
+)
+
+
+class IdentityIdMapping:
+    """index_to_docstore_id без словаря: id чанка в хранилище совпадает с позицией в индексе"""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position):
+        position = int(position)
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return position
+
+    def get(self, position, default=None):
+        try:
+            return self[position]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def items(self):
+        return ((position, position) for position in range(self.size))
+
+    def values(self):
+        return iter(range(self.size))
+
+
+class ChunkStore:
+    """Тексты и метаданные чанков в SQLite, читаются только для найденных позиций.
+
+    Совместим с интерфейсом docstore, который использует FAISS из LangChain
+    (метод search). Файл открывается только на чтение, у каждого потока
+    своё соединение, поэтому несколько процессов и потоков читают его
+    параллельно через общий страничный кеш. Рядом с чанками лежит
+    инвертированный индекс BM25 для лексического поиска (lexical_search).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._vectors = None
+
+    @staticmethod
+    def exists(index_path: str) -> bool:
+        """Есть ли хранилище чанков актуальной версии"""
+        path = os.path.join(index_path, CHUNKS_FILE)
+        if not os.path.exists(path):
+            return False
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0] >= CHUNK_STORE_VERSION
+        finally:
+            conn.close()
+
+    @staticmethod
+    def write(index_path: str, documents):
+        """Записывает чанки в порядке позиций индекса (id = позиция) и строит по ним BM25"""
+        with ChunkStoreWriter(index_path) as writer:
+            writer.add(documents)
+
+    @classmethod
+    def open(cls, index_path: str):
+        return cls(os.path.join(index_path, CHUNKS_FILE))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def search(self, search):
+        row = self._conn().execute(
+            "SELECT text, metadata FROM chunks WHERE id = ?", (int(search),)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=str(int(search)), page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        raise RuntimeError(READ_ONLY_MESSAGE)
+
+    def delete(self, ids):
+        raise RuntimeError(READ_ONLY_MESSAGE)
+
+    def iter_documents(self):
+        for position, text, metadata in self._conn().execute("SELECT id, text, metadata FROM chunks ORDER BY id"):
+            yield Document(id=str(position), page_content=text, metadata=json.loads(metadata))
+
+    def _postings(self, term):
+        return self._conn().execute(
+            "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk_id WHERE p.term = ?",
+            (term,)
+        ).fetchall()
+
+    def lexical_search(self, query: str, k: int = 4, positions=None):
+        """BM25 по чанкам: [(документ, оценка в [0, 1))]; positions ограничивает поиск набором позиций"""
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            stats = self._conn().execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            self._local.stats = stats
+        n_docs, avg_length = stats
+        allowed = set(int(position) for position in positions) if positions is not None else None
+        ranked = bm25_search(query, self._postings, n_docs, avg_length or 1.0, k, allowed)
+        return [(self.search(position), score) for position, score in ranked]
+
+    def vectors(self, positions):
+        """Векторы чанков из vectors.npy той же сборки (mmap), None если файла нет"""
+        if self._vectors is None:
+            path = os.path.join(os.path.dirname(self.path), VECTORS_FILE)
+            if not os.path.exists(path):
+                return None
+            self._vectors = np.load(path, mmap_mode="r")
+        return np.asarray(self._vectors[np.asarray(positions, dtype=np.int64)], dtype=np.float32)
+
+    def chapter_positions(self) -> dict:
+        """{глава: [позиции чанков]} без чтения текстов"""
+        positions = {}
+        for position, chapter in self._conn().execute("SELECT id, chapter FROM chunks ORDER BY id"):
+            positions.setdefault(chapter, []).append(position)
+        return positions
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+class ChunkStoreWriter:
+    """Потоковая запись хранилища чанков: батчи дописываются по мере эмбеддинга.
+
+    Запись идёт во временный файл, который заменяет рабочий только в
+    commit(), поэтому прерванная сборка не портит прежнее хранилище.
+    id чанка — его позиция в индексе, то есть порядковый номер в записи.
+    """
+
+    def __init__(self, index_path: str):
+        self.path = os.path.join(index_path, CHUNKS_FILE)
+        self.tmp_path = self.path + ".tmp"
+        os.makedirs(index_path, exist_ok=True)
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute(
+            "CREATE TABLE chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, chapter TEXT, length INTEGER NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE postings (term TEXT NOT NULL, chunk_id INTEGER NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self.count = 0
+
+    def add(self, documents):
+        """Дописывает чанки следующими позициями"""
+        for doc in documents:
+            counts = Counter(tokenize(doc.page_content))
+            self.conn.execute(
+                "INSERT INTO chunks (id, text, metadata, chapter, length) VALUES (?, ?, ?, ?, ?)",
+                (self.count, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False),
+                 doc.metadata.get("chapter"), sum(counts.values()))
+            )
+            self.conn.executemany(
+                "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                ((term, self.count, tf) for term, tf in counts.items())
+            )
+            self.count += 1
+        # Тексты батча уходят на диск, в памяти их не держим
+        self.conn.commit()
+
+    def commit(self):
+        self.conn.execute("CREATE INDEX chunks_chapter ON chunks(chapter)")
+        self.conn.execute(f"PRAGMA user_version = {CHUNK_STORE_VERSION}")
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.conn.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
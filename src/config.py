@@ -9,4 +9,135 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # RAG конфигурация
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
-MODEL_NAME = 'gpt-4o-mini' 
\ No newline at end of file
+MODEL_NAME = 'gpt-4o-mini' 
+
+# Бэкенды моделей: openai — API по OPENAI_BASE_URL; hashing/fake — локальные
+# заменители без сети (см. src/backends.py и src/fake_openai_server.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.proxyapi.ru/openai/v1")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# Проверка длины текста через tiktoken: словарь скачивается из сети, офлайн выключается
+EMBEDDING_CTX_CHECK = os.getenv("EMBEDDING_CTX_CHECK", "1") == "1"
+HASHING_EMBED_DIM = int(os.getenv("HASHING_EMBED_DIM", "256"))
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))  # до первого токена, секунд
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.02"))  # между токенами, секунд
+
+# Общий HTTP-клиент моделей (src/http_transport.py): пул keep-alive соединений,
+# повторы при 429/5xx с экспоненциальной задержкой и срок на весь вызов
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "16"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # секунд простоя
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "4"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+HTTP_DEADLINE = float(os.getenv("HTTP_DEADLINE", "60"))  # на вызов со всеми повторами, секунд
+# Дублирующий запрос эмбеддингов, если ответа нет дольше N секунд; 0 — выключено
+HEDGE_EMBEDDINGS_AFTER = float(os.getenv("HEDGE_EMBEDDINGS_AFTER", "0"))
+
+# Построение индекса: размер батча и число параллельных запросов эмбеддингов
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+# Тип индекса FAISS: flat (точный), hnsw, ivfpq, sq8, fp16 — см. index_factory.py
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+HNSW_M = 32
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_SUBVECTORS = 64
+# Извлечение текста PDF в пуле процессов (1 — последовательно)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 16
+
+# Поиск только по главам, упомянутым в вопросе (например, «стоики» -> «Глава 7. Стоицизм»)
+CHAPTER_ROUTING = os.getenv("CHAPTER_ROUTING", "1") == "1"
+
+# Гибридный поиск: BM25 по чанкам + векторный поиск, слияние по RRF
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # кандидатов от каждого поиска до слияния
+RRF_K = 60
+# Уверенное лексическое совпадение отвечает без эмбеддинга вопроса, векторного поиска и MMR.
+# Нормированная оценка BM25 однотермового вопроса почти всегда высока, поэтому лучший
+# чанк должен содержать не меньше LEXICAL_MIN_TERMS разных термов вопроса; по умолчанию выключено
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "0") == "1"
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "0.5"))
+LEXICAL_MIN_TERMS = int(os.getenv("LEXICAL_MIN_TERMS", "2"))
+
+# MMR: из MMR_CANDIDATES кандидатов выбираются k непохожих друг на друга;
+# MMR_LAMBDA = 1 — только близость к вопросу, 0 — только разнообразие
+MMR_ENABLED = os.getenv("MMR_ENABLED", "1") == "1"
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Корпус книг: CORPUS_MODE=1 — индекс-шард для каждого PDF из DOCS_DIR
+CORPUS_MODE = os.getenv("CORPUS_MODE", "0") == "1"
+DOCS_DIR = os.getenv("DOCS_DIR", "docs")
+CORPUS_SEARCH_WORKERS = int(os.getenv("CORPUS_SEARCH_WORKERS", "8"))
+
+# Конфигурация бота
+# polling — синхронный TeleBot, async — AsyncTeleBot с пулом обработчиков,
+# webhook — AsyncTeleBot, обновления приходят POST-запросами (src/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_MAX_WORKERS = int(os.getenv("BOT_MAX_WORKERS", "16"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+# Потоковый ответ: сообщение в Telegram редактируется по мере генерации,
+# не чаще раза в STREAM_EDIT_INTERVAL секунд (лимиты Telegram на правки)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Быстрый старт: бот начинает принимать сообщения сразу, индекс загружается
+# в фоновом потоке (до готовности бот отвечает «запускаюсь»). WARMUP_QUERY —
+# вопрос для прогрева соединений и кешей без вызова модели; пустой — без прогрева
+BACKGROUND_LOAD = os.getenv("BACKGROUND_LOAD", "1") == "1"
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "Что такое философия?")
+
+# Допуск вопросов (src/admission.py): не больше ADMISSION_CHAT_RATE вопросов в секунду
+# на чат с запасом ADMISSION_CHAT_BURST, ADMISSION_CONCURRENCY одновременно, остальные —
+# в общей очереди, которая обходит чаты по кругу. Переполнение — ответ «занят»
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "20"))  # ожидание места в очереди, секунд
+ADMISSION_CHAT_RATE = float(os.getenv("ADMISSION_CHAT_RATE", "0.2"))  # 0 — без лимита на чат
+ADMISSION_CHAT_BURST = float(os.getenv("ADMISSION_CHAT_BURST", "3"))
+
+# Вебхук: сервер слушает WEBHOOK_PORT, обновления разбирают WEBHOOK_WORKERS обработчиков.
+# WEBHOOK_URL — внешний адрес сервера; если задан, вебхук регистрируется при запуске
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Адрес Bot API, например локального validation/webhook_test.py; пустой — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Метрики Prometheus на http://<хост>:METRICS_PORT/metrics; 0 — выключить.
+# В режиме webhook при совпадении с WEBHOOK_PORT /metrics отдаёт сервер вебхука
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+
+# История диалогов по чатам
+# memory — в памяти процесса, sqlite — в файле SESSION_DB_PATH
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite")
+SESSION_MAX_CHATS = int(os.getenv("SESSION_MAX_CHATS", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))  # секунд без сообщений
+HISTORY_WINDOW = 2  # пар вопрос-ответ в истории
+
+# Бюджет промпта в токенах: инструкции, история, контекст и вопрос вместе;
+# история занимает не больше HISTORY_TOKEN_BUDGET
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "800"))
+
+# Одинаковые одновременные вопросы обрабатываются один раз (src/single_flight.py);
+# COALESCE_BY_HISTORY=0 объединяет их и при разной истории диалога
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+COALESCE_BY_HISTORY = os.getenv("COALESCE_BY_HISTORY", "1") == "1"
+
+# Семантический кеш ответов
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # косинусная близость
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
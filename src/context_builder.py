@@ -0,0 +1,98 @@
+from session_store import format_history
+from config import MODEL_NAME, PROMPT_TOKEN_BUDGET, HISTORY_TOKEN_BUDGET
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(MODEL_NAME)
+        except Exception:
+            # Нет tiktoken или словаря (без сети) — считаем приблизительно
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста для MODEL_NAME; без tiktoken — оценка ~3 символа на токен"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 3 + 1
+
+
+class ContextBuilder:
+    """Собирает контекст и историю для промпта в пределах бюджета токенов.
+
+    Фрагменты идут в порядке релевантности и добавляются целиком, пока
+    помещаются; первый фрагмент при нехватке места обрезается, чтобы
+    в промпте всегда было хотя бы одно свидетельство. История берётся
+    с последних реплик и ограничена history_budget. Для каждого запроса
+    возвращается число токенов по разделам промпта.
+    """
+
+    def __init__(self, format_docs, instruction_tokens: int, budget: int = PROMPT_TOKEN_BUDGET,
+                 history_budget: int = HISTORY_TOKEN_BUDGET):
+        self.format_docs = format_docs
+        self.instruction_tokens = instruction_tokens
+        self.budget = budget
+        self.history_budget = history_budget
+
+    def _pack_history(self, turns, budget: int):
+        kept = []
+        used = 0
+        for turn in reversed(list(turns)):
+            tokens = count_tokens(format_history([turn])) + 1
+            if used + tokens > budget:
+                break
+            kept.insert(0, turn)
+            used += tokens
+        return format_history(kept), kept
+
+    def _pack_docs(self, docs, budget: int):
+        context = []
+        used = 0
+        packed = []
+        for doc, text in zip(docs, self.format_docs(docs)):
+            tokens = count_tokens(text) + 1
+            if used + tokens > budget:
+                if context:
+                    continue
+                # Обрезаем первый фрагмент до бюджета с запасом на неточность оценки
+                text = text[:max(0, budget - used) * len(text) // tokens].strip()
+                if not text:
+                    # Бюджета не хватило и на обрезанный фрагмент: в промпт он не попал,
+                    # значит, и в источниках его быть не должно
+                    continue
+                tokens = count_tokens(text) + 1
+            context.append(text)
+            packed.append(doc)
+            used += tokens
+        return "\n".join(context), packed
+
+    def build(self, question: str, docs, turns=()):
+        """Возвращает входы промпта (input, history, context), упакованные документы и счётчики токенов"""
+        question_tokens = count_tokens(question)
+        available = max(0, self.budget - self.instruction_tokens - question_tokens)
+        # История ужимается первой: место под неё резервируется только в пределах history_budget
+        history, kept_turns = self._pack_history(turns, min(self.history_budget, available))
+        history_tokens = count_tokens(history)
+        context, packed = self._pack_docs(docs, available - history_tokens)
+        context_tokens = count_tokens(context)
+        return {
+            "inputs": {"input": question, "history": history, "context": context},
+            "documents": packed,
+            "turns": len(kept_turns),
+            "tokens": {
+                "instructions": self.instruction_tokens,
+                "history": history_tokens,
+                "context": context_tokens,
+                "question": question_tokens,
+                "total": self.instruction_tokens + history_tokens + context_tokens + question_tokens,
+            },
+        }
@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from answer_cache import index_fingerprint
+from chapter_search import ChapterFilteredStore
+from config import CORPUS_SEARCH_WORKERS
+from document_processor import DocumentProcessor
+
+
+class Corpus:
+    """Полка книг: отдельный индекс FAISS (шард) на каждую книгу.
+
+    Поиск идёт по шардам параллельно, результаты сливаются по расстоянию.
+    Интерфейс поиска совпадает с FAISS, поэтому Corpus можно передать
+    в RAGSystem.initialize_from_docs вместо одного векторного хранилища.
+    """
+
+    def __init__(self, shards: dict, max_workers: int = CORPUS_SEARCH_WORKERS):
+        # Имя PDF-файла книги -> векторное хранилище
+        self.shards = shards
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(shards))),
+            thread_name_prefix="corpus-search"
+        )
+
+    @classmethod
+    def from_directory(cls, docs_dir: str, embeddings):
+        """Строит или загружает шард для каждого PDF в docs_dir.
+
+        Шарды независимы: новая книга эмбеддится отдельно, остальные просто загружаются.
+        """
+        shards = {}
+        for file_path in sorted(glob.glob(os.path.join(docs_dir, "*.pdf"))):
+            print(f"Книга: {os.path.basename(file_path)}")
+            vectorstore = DocumentProcessor.process_pdf(file_path, embeddings)
+            shards[os.path.basename(file_path)] = ChapterFilteredStore(vectorstore)
+        if not shards:
+            raise ValueError(f"В каталоге {docs_dir} нет PDF-файлов")
+        return cls(shards)
+
+    @property
+    def books(self):
+        return list(self.shards)
+
+    def fingerprint(self) -> str:
+        """Отпечаток всех шардов: меняется при пересборке любой книги"""
+        digest = hashlib.sha256()
+        for book in sorted(self.shards):
+            digest.update(index_fingerprint(DocumentProcessor.embeddings_path(book)).encode())
+        return digest.hexdigest()
+
+    def _shard_chapters(self, book, chapters):
+        """Главы из chapters, которые есть в книге; None — книга ищется без фильтра по главам.
+
+        Главы определяются по одной книге, поэтому остальные книги
+        корпуса не должны выпадать из поиска из-за чужого фильтра.
+        """
+        if not chapters:
+            return None
+        known = [chapter for chapter in chapters if chapter in self.shards[book].chapter_ids]
+        return known or None
+
+    def _search_shard(self, book, embedding, k, chapters=None, **kwargs):
+        results = self.shards[book].similarity_search_with_score_by_vector(
+            embedding, k=k, chapters=self._shard_chapters(book, chapters), **kwargs
+        )
+        for doc, _ in results:
+            doc.metadata["book"] = book
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, books=None, **kwargs):
+        """Ищет по шардам выбранных книг (по умолчанию всех) и возвращает общий top-k.
+
+        Фильтр chapters применяется только к книгам, в которых есть эти главы.
+        """
+        selected = [book for book in (books or self.shards) if book in self.shards]
+        if not selected:
+            raise ValueError(f"Книги не найдены в корпусе: {books}")
+        if len(selected) == 1:
+            results = self._search_shard(selected[0], embedding, k, **kwargs)
+        else:
+            futures = [self._executor.submit(self._search_shard, book, embedding, k, **kwargs) for book in selected]
+            results = [item for future in futures for item in future.result()]
+        # Чем меньше расстояние, тем ближе документ
+        results.sort(key=lambda item: item[1])
+        return results[:k]
+
+    def _lexical_search_shard(self, book, query, k, chapters):
+        results = self.shards[book].lexical_search_with_score(query, k, self._shard_chapters(book, chapters))
+        for doc, _ in results:
+            doc.metadata["book"] = book
+        return results
+
+    def lexical_search_with_score(self, query: str, k: int = 4, books=None, chapters=None):
+        """BM25 по шардам; оценки нормированы, поэтому общий top-k берётся по убыванию оценки.
+
+        Как и в векторном поиске, chapters сужает только книги с этими главами.
+        """
+        selected = [book for book in (books or self.shards) if book in self.shards]
+        futures = [self._executor.submit(self._lexical_search_shard, book, query, k, chapters) for book in selected]
+        results = [item for future in futures for item in future.result()]
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, books=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, books, **kwargs)]
+
+    def embeddings_for(self, docs):
+        """Векторы документов из разных книг, в порядке docs; None, если какой-то книге их не достать"""
+        by_book = {}
+        for i, doc in enumerate(docs):
+            by_book.setdefault(doc.metadata["book"], []).append(i)
+        vectors = None
+        for book, indices in by_book.items():
+            book_vectors = self.shards[book].embeddings_for([docs[i] for i in indices])
+            if book_vectors is None:
+                return None
+            if vectors is None:
+                vectors = np.empty((len(docs), book_vectors.shape[1]), dtype=np.float32)
+            vectors[indices] = book_vectors
+        return vectors
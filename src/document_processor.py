@@ -1,66 +1,186 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+import faiss
+import numpy as np
+from config import CHUNK_SIZE, CHUNK_OVERLAP, EMBED_BATCH_SIZE, INDEX_TYPE
 import os
+from functools import partial
 from books import find_chapter_for_page
+import index_manifest
+from embedding_pipeline import BatchEmbedder
+from pdf_extraction import iter_prepared_pages
+from index_factory import build_index, configure_search
+from chunk_store import ChunkStore, ChunkStoreWriter, IdentityIdMapping
 
 class DocumentProcessor:
+    EMBEDDINGS_DIR = "embeddings"
+    INDEX_FILE = "index.faiss"
+
     @staticmethod
-    def process_pdf(file_path: str, embeddings):
-        # Создаем имя для файла эмбеддингов на основе имени PDF
+    def embeddings_path(file_path: str) -> str:
+        """Путь к индексу эмбеддингов для PDF-файла"""
         pdf_name = os.path.basename(file_path)
-        embeddings_dir = "embeddings"
-        embeddings_path = os.path.join(embeddings_dir, os.path.splitext(pdf_name)[0])
+        return os.path.join(DocumentProcessor.EMBEDDINGS_DIR, os.path.splitext(pdf_name)[0])
 
-        # Проверяем, существуют ли уже эмбеддинги
-        if os.path.exists(embeddings_path):
-            print("Загружаем существующие эмбеддинги...")
-            return FAISS.load_local(embeddings_path, embeddings, allow_dangerous_deserialization=True)
-
-        print("Создаем новые эмбеддинги...")
-
-        # Загружаем PDF
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
-        
-        # Очистка и нормализация текста
-        for doc in documents:
-            cleaned_content = doc.page_content.replace('\n', ' ').strip()
-            doc.page_content = " ".join(cleaned_content.split())
-            
-            # Получаем номер страницы из метаданных
-            page_num = doc.metadata.get("page", 0)
-            
-            # Добавляем информацию о главе из предопределенных метаданных
-            chapter_title = find_chapter_for_page(pdf_name, page_num)
-            if chapter_title:
-                doc.metadata["chapter"] = chapter_title
-                # Форматируем номер страницы
-                doc.metadata["page"] = f"Страница {page_num}"
-            
-            # Фильтруем метаданные
-            doc.metadata = {
-                key: value 
-                for key, value in doc.metadata.items() 
-                if key in ["page", "chapter"]
-            }
-            
-        # Разделяем документы на чанки
-        text_splitter = RecursiveCharacterTextSplitter(
+    @staticmethod
+    def prepare_page(doc, pdf_name: str):
+        """Очищает текст страницы и оставляет в метаданных только страницу и главу"""
+        cleaned_content = doc.page_content.replace('\n', ' ').strip()
+        doc.page_content = " ".join(cleaned_content.split())
+
+        # Получаем номер страницы из метаданных
+        page_num = doc.metadata.get("page", 0)
+
+        # Добавляем информацию о главе из предопределенных метаданных
+        chapter_title = find_chapter_for_page(pdf_name, page_num)
+        if chapter_title:
+            doc.metadata["chapter"] = chapter_title
+            # Форматируем номер страницы
+            doc.metadata["page"] = f"Страница {page_num}"
+
+        # Фильтруем метаданные
+        doc.metadata = {
+            key: value
+            for key, value in doc.metadata.items()
+            if key in ["page", "chapter"]
+        }
+        return doc
+
+    @staticmethod
+    def text_splitter():
+        return RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
             separators=["\n\n", "\n", " ", ""]
         )
-        documents = text_splitter.split_documents(documents)
-        
-        # Создаем и сохраняем векторное хранилище
-        vectorstore = FAISS.from_documents(documents, embeddings)
-        
-        # Создаем директорию, если её нет
-        os.makedirs(embeddings_dir, exist_ok=True)
-        
-        # Сохраняем эмбеддинги
-        vectorstore.save_local(embeddings_path)
-        
-        return vectorstore
\ No newline at end of file
+
+    @staticmethod
+    def iter_chunks(file_path: str, page_hashes: list):
+        """Потоково: страница извлекается, очищается, размечается главой и режется на чанки.
+
+        Хеши страниц дописываются в page_hashes по мере чтения.
+        """
+        pdf_name = os.path.basename(file_path)
+        text_splitter = DocumentProcessor.text_splitter()
+        # При PDF_EXTRACT_WORKERS > 1 страницы извлекаются и очищаются в пуле процессов
+        prepare = partial(DocumentProcessor.prepare_page, pdf_name=pdf_name)
+        for page in iter_prepared_pages(file_path, prepare):
+            page_hashes.append(index_manifest.content_hash(page.page_content, page.metadata))
+            # Сплиттер режет каждую страницу отдельно, поэтому результат тот же, что у split_documents
+            yield from text_splitter.split_documents([page])
+
+    @staticmethod
+    def iter_chunk_batches(chunks, stored_vectors: dict, batch_size: int = EMBED_BATCH_SIZE):
+        """Группирует чанки в батчи: (чанки с хешами, тексты, которым нужен эмбеддинг)"""
+        batch = []
+        for chunk in chunks:
+            batch.append((chunk, index_manifest.content_hash(chunk.page_content, chunk.metadata)))
+            if len(batch) == batch_size:
+                yield batch, [chunk.page_content for chunk, chunk_hash in batch if chunk_hash not in stored_vectors]
+                batch = []
+        if batch:
+            yield batch, [chunk.page_content for chunk, chunk_hash in batch if chunk_hash not in stored_vectors]
+
+    @staticmethod
+    def save_index(index, embeddings_path: str):
+        """Сохраняет индекс в формате FAISS; тексты чанков уже записаны в SQLite, без pickle"""
+        faiss.write_index(index, os.path.join(embeddings_path, DocumentProcessor.INDEX_FILE))
+        # Файл прежнего формата (save_local) больше не нужен
+        legacy_docstore = os.path.join(embeddings_path, "index.pkl")
+        if os.path.exists(legacy_docstore):
+            os.remove(legacy_docstore)
+
+    @staticmethod
+    def load_vectorstore(embeddings_path: str, embeddings):
+        """Открывает индекс через mmap, тексты чанков читаются из SQLite только для найденных позиций.
+
+        Холодный старт не зависит от размера книги, а несколько процессов
+        разделяют одни и те же страницы файла в кеше ОС.
+        """
+        index_file = os.path.join(embeddings_path, DocumentProcessor.INDEX_FILE)
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Старые версии FAISS умеют mmap не для всех типов индекса
+            index = faiss.read_index(index_file)
+        configure_search(index)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=ChunkStore.open(embeddings_path),
+            index_to_docstore_id=IdentityIdMapping(index.ntotal)
+        )
+
+    @staticmethod
+    def process_pdf(file_path: str, embeddings):
+        """Возвращает векторное хранилище для PDF, пересобирая его только при изменениях.
+
+        Рядом с индексом хранится манифест с хешами PDF, страниц и чанков и
+        параметрами разбиения. Если PDF, CHUNK_SIZE/CHUNK_OVERLAP или модель
+        эмбеддингов изменились, индекс пересобирается, но эмбеддинги
+        запрашиваются только для новых или изменённых чанков. Смена
+        INDEX_TYPE перестраивает только индекс из сохранённых векторов.
+        """
+        # Создаем имя для файла эмбеддингов на основе имени PDF
+        pdf_name = os.path.basename(file_path)
+        embeddings_path = DocumentProcessor.embeddings_path(file_path)
+        model = index_manifest.embedding_model_name(embeddings)
+        pdf_sha256 = index_manifest.file_sha256(file_path)
+
+        # Проверяем, актуальны ли существующие эмбеддинги
+        manifest = index_manifest.load_manifest(embeddings_path)
+        up_to_date = index_manifest.is_up_to_date(manifest, pdf_sha256, CHUNK_SIZE, CHUNK_OVERLAP, model, INDEX_TYPE)
+        if up_to_date and ChunkStore.exists(embeddings_path):
+            print("Загружаем существующие эмбеддинги...")
+            return DocumentProcessor.load_vectorstore(embeddings_path, embeddings)
+
+        print("Создаем новые эмбеддинги..." if manifest is None else "Обновляем эмбеддинги...")
+
+        # Переиспользуем векторы неизменившихся чанков, остальные эмбеддим.
+        # Страницы читаются и режутся потоково, пока предыдущие батчи эмбеддятся;
+        # тексты каждого батча сразу уходят в хранилище чанков, в памяти
+        # остаются только векторы и хеши
+        stored_vectors = index_manifest.load_stored_vectors(embeddings_path, manifest, model)
+        embedder = BatchEmbedder(embeddings, checkpoint_dir=os.path.join(embeddings_path, "checkpoints"))
+        page_hashes = []
+        chunk_hashes = []
+        vector_batches = []
+        embedded = 0
+        batches = DocumentProcessor.iter_chunk_batches(
+            DocumentProcessor.iter_chunks(file_path, page_hashes), stored_vectors, embedder.batch_size
+        )
+        with ChunkStoreWriter(embeddings_path) as writer:
+            for batch, new_vectors in embedder.embed_stream(batches):
+                new_vectors = iter(new_vectors)
+                batch_vectors = []
+                for chunk, chunk_hash in batch:
+                    if chunk_hash in stored_vectors:
+                        batch_vectors.append(stored_vectors[chunk_hash])
+                    else:
+                        batch_vectors.append(next(new_vectors))
+                        embedded += 1
+                    chunk_hashes.append(chunk_hash)
+                vector_batches.append(np.asarray(batch_vectors, dtype=np.float32))
+                writer.add(chunk for chunk, _ in batch)
+
+            if not chunk_hashes:
+                raise ValueError(f"В файле {file_path} не найдено текста")
+        print(f"Чанков: {len(chunk_hashes)}, получено новых эмбеддингов: {embedded}")
+        if manifest is not None:
+            changed_pages = len(set(page_hashes) - set(manifest["pages"]))
+            print(f"Изменено страниц: {changed_pages} из {len(page_hashes)}")
+
+        # Индекс выбранного типа строится из векторов, без docstore в памяти
+        vectors = np.concatenate(vector_batches)
+        del vector_batches
+
+        # Сохраняем эмбеддинги, манифест — последним
+        DocumentProcessor.save_index(build_index(vectors, INDEX_TYPE), embeddings_path)
+        index_manifest.save_vectors(embeddings_path, vectors)
+        index_manifest.save_manifest(embeddings_path, index_manifest.build_manifest(
+            pdf_sha256, CHUNK_SIZE, CHUNK_OVERLAP, model, page_hashes, chunk_hashes, INDEX_TYPE
+        ))
+        embedder.clear_checkpoints()
+
+        # Дальше работаем с сохранённой копией: тексты чанков не держим в памяти
+        return DocumentProcessor.load_vectorstore(embeddings_path, embeddings)
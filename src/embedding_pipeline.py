@@ -0,0 +1,111 @@
+import hashlib
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from config import EMBED_BATCH_SIZE, EMBED_MAX_WORKERS
+from metrics import span, EMBEDDED_TEXTS
+
+
+class BatchEmbedder:
+    """Эмбеддинг чанков батчами с ограниченным числом параллельных запросов.
+
+    Каждый готовый батч сохраняется в checkpoint_dir под хешем своих
+    текстов, поэтому после сбоя повторный запуск запрашивает только
+    недостающие батчи.
+    """
+
+    def __init__(self, embeddings, batch_size: int = EMBED_BATCH_SIZE,
+                 max_workers: int = EMBED_MAX_WORKERS, checkpoint_dir: str = None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.checkpoint_dir = checkpoint_dir
+        self.restored_batches = 0
+
+    def _checkpoint_path(self, texts):
+        digest = hashlib.sha256()
+        for text in texts:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        return os.path.join(self.checkpoint_dir, f"{digest.hexdigest()}.npy")
+
+    def _load_checkpoint(self, texts):
+        if not self.checkpoint_dir:
+            return None
+        path = self._checkpoint_path(texts)
+        if not os.path.exists(path):
+            return None
+        vectors = np.load(path)
+        return vectors if len(vectors) == len(texts) else None
+
+    def _embed_batch(self, texts):
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = self._load_checkpoint(texts)
+        if vectors is not None:
+            self.restored_batches += 1
+            return vectors
+        with span("embed_batch"):
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        EMBEDDED_TEXTS.inc(len(texts))
+        if self.checkpoint_dir:
+            # Пишем во временный файл и переименовываем, чтобы не оставить битый батч
+            path = self._checkpoint_path(texts)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, vectors)
+            os.replace(path + ".tmp", path)
+        return vectors
+
+    def embed_stream(self, batches):
+        """Принимает поток пар (payload, тексты) и отдаёт (payload, векторы) в том же порядке.
+
+        Входной поток читается лениво: пока очередные батчи эмбеддятся в пуле,
+        вызывающий код успевает подготовить следующие. Одновременно в работе
+        не больше 2 * max_workers батчей, так что память не зависит от размера книги.
+        """
+        if self.checkpoint_dir:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+        max_in_flight = 2 * self.max_workers
+        in_flight = deque()
+        started = time.time()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for payload, texts in batches:
+                in_flight.append((payload, executor.submit(self._embed_batch, list(texts))))
+                while len(in_flight) >= max_in_flight or (in_flight and in_flight[0][1].done()):
+                    yield self._pop_result(in_flight)
+                    done += 1
+                    print(f"Эмбеддинги: {done} батчей ({time.time() - started:.1f} с)")
+            while in_flight:
+                yield self._pop_result(in_flight)
+                done += 1
+                print(f"Эмбеддинги: {done} батчей ({time.time() - started:.1f} с)")
+        if self.restored_batches:
+            print(f"Восстановлено из контрольных точек батчей: {self.restored_batches}")
+
+    @staticmethod
+    def _pop_result(in_flight):
+        payload, future = in_flight.popleft()
+        try:
+            return payload, future.result()
+        except Exception as e:
+            # Уже отправленные батчи дорабатывают и сохраняются в контрольные точки
+            wait([future for _, future in in_flight])
+            raise RuntimeError("Не удалось получить эмбеддинги, "
+                               "повторный запуск продолжит с контрольной точки") from e
+
+    def embed(self, texts):
+        """Возвращает матрицу эмбеддингов в порядке texts"""
+        texts = list(texts)
+        batches = ((None, texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size))
+        results = [vectors for _, vectors in self.embed_stream(batches)]
+        return np.vstack(results) if results else np.zeros((0, 0), dtype=np.float32)
+
+    def clear_checkpoints(self):
+        if self.checkpoint_dir and os.path.exists(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
@@ -0,0 +1,146 @@
+"""Локальный сервер с API OpenAI поверх офлайн-бэкендов.
+
+Отвечает на /v1/embeddings (HashingEmbeddings) и /v1/chat/completions
+(извлекающий ответ FakeChatModel, в том числе stream=true), поэтому
+бот и скрипты валидации работают с ним без изменений кода:
+
+    python src/fake_openai_server.py --port 8001
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=local EMBEDDING_MODEL=hashing-256 \\
+        EMBEDDING_CTX_CHECK=0 python src/main.py
+
+Задержки модели задаются FAKE_LLM_LATENCY и FAKE_LLM_TOKEN_DELAY,
+как у FakeChatModel в процессе.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backends import HashingEmbeddings, extractive_answer, split_tokens
+from config import HASHING_EMBED_DIM, FAKE_LLM_LATENCY, FAKE_LLM_TOKEN_DELAY
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    embeddings = HashingEmbeddings()
+    latency = FAKE_LLM_LATENCY
+    token_delay = FAKE_LLM_TOKEN_DELAY
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса мешает нагрузочным замерам
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Некорректный JSON", "type": "invalid_request_error"}})
+            return
+        path = self.path.rstrip("/")
+        if path.endswith("/embeddings"):
+            self._embeddings(request)
+        elif path.endswith("/chat/completions"):
+            self._chat(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Неизвестный путь {self.path}", "type": "invalid_request_error"}})
+
+    def _embeddings(self, request):
+        inputs = request.get("input", [])
+        # Одна строка или один список токенов — это один вход
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = [
+            {"object": "embedding", "index": i, "embedding": self.embeddings.embed_text(text)}
+            for i, text in enumerate(inputs)
+        ]
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", self.embeddings.model),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _chat(self, request):
+        prompt = "\n".join(
+            message["content"] if isinstance(message.get("content"), str) else json.dumps(message.get("content"))
+            for message in request.get("messages", [])
+        )
+        answer = extractive_answer(prompt)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "fake-extractive")
+        created = int(time.time())
+        time.sleep(self.latency)
+        if not request.get("stream"):
+            time.sleep(self.token_delay * len(split_tokens(answer)))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for i, token in enumerate(split_tokens(answer)):
+            if i:
+                time.sleep(self.token_delay)
+            event({"content": token})
+        event({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер с API OpenAI (эмбеддинги и чат)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--dim", type=int, default=HASHING_EMBED_DIM, help="Размерность эмбеддингов")
+    parser.add_argument("--latency", type=float, default=FAKE_LLM_LATENCY, help="Задержка до первого токена, секунд")
+    parser.add_argument("--token-delay", type=float, default=FAKE_LLM_TOKEN_DELAY, help="Задержка между токенами, секунд")
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.embeddings = HashingEmbeddings(args.dim)
+    FakeOpenAIHandler.latency = args.latency
+    FakeOpenAIHandler.token_delay = args.token_delay
+    server = ThreadingHTTPServer((args.host, args.port), FakeOpenAIHandler)
+    print(f"Локальный OpenAI API: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
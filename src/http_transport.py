@@ -0,0 +1,158 @@
+"""Общий HTTP-клиент для вызовов моделей: эмбеддинги, чат и оценщик.
+
+Один пул keep-alive соединений на процесс. Повторы при 429/5xx и
+сетевых ошибках делаются здесь, с экспоненциальной задержкой со
+случайным разбросом и в пределах срока на вызов (HTTP_DEADLINE);
+собственные повторы SDK OpenAI отключаются (max_retries=0), чтобы
+не умножать попытки. Запросы эмбеддингов можно дублировать (hedging):
+если ответ не пришёл за HEDGE_EMBEDDINGS_AFTER секунд, отправляется
+второй такой же запрос и берётся тот, что ответит первым.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+
+from config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+    HTTP_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_DEADLINE, HEDGE_EMBEDDINGS_AFTER
+)
+from metrics import HTTP_RETRIES_TOTAL, HTTP_HEDGES
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+HEDGED_PATHS = ("/embeddings",)
+
+
+def backoff_delay(attempt: int, response=None, base: float = HTTP_BACKOFF_BASE, cap: float = HTTP_BACKOFF_MAX) -> float:
+    """Задержка перед повтором: полный случайный разброс до base·2^(attempt-1), но не меньше Retry-After"""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(cap, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
+
+
+def _close_quietly(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    future.result().close()
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Транспорт httpx с повторами, сроком на вызов и дублированием медленных запросов"""
+
+    def __init__(self, limits: httpx.Limits, retries: int = HTTP_RETRIES, deadline: float = HTTP_DEADLINE,
+                 hedge_after: float = HEDGE_EMBEDDINGS_AFTER):
+        self._transport = httpx.HTTPTransport(limits=limits)
+        self.retries = retries
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self._hedge_pool = None
+        if hedge_after > 0:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=limits.max_connections or 16,
+                                                  thread_name_prefix="http-hedge")
+
+    def _attempt_request(self, request: httpx.Request, remaining: float) -> httpx.Request:
+        # Таймауты попытки не длиннее оставшегося срока вызова
+        timeout = dict(request.extensions.get("timeout") or {})
+        for key in ("connect", "read", "write", "pool"):
+            value = timeout.get(key)
+            timeout[key] = remaining if value is None else min(value, remaining)
+        return httpx.Request(
+            request.method, request.url, headers=request.headers, content=request.content,
+            extensions={**request.extensions, "timeout": timeout}
+        )
+
+    def _hedged(self, request: httpx.Request, remaining: float) -> httpx.Response:
+        if remaining <= self.hedge_after:
+            # Второй запрос стартовал бы уже после срока — отправляем один
+            return self._transport.handle_request(self._attempt_request(request, remaining))
+        primary = self._hedge_pool.submit(self._transport.handle_request, self._attempt_request(request, remaining))
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        HTTP_HEDGES.inc(result="sent")
+        remaining -= self.hedge_after
+        secondary = self._hedge_pool.submit(self._transport.handle_request, self._attempt_request(request, remaining))
+        pending = {primary, secondary}
+        error = None
+        deadline = time.monotonic() + remaining
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        HTTP_HEDGES.inc(result="won")
+                    # Ответ опоздавшего запроса закрываем, когда он придёт
+                    for other in pending:
+                        other.add_done_callback(_close_quietly)
+                    return future.result()
+                error = future.exception()
+        for other in pending:
+            other.add_done_callback(_close_quietly)
+        raise error or httpx.ReadTimeout("Истёк срок запроса", request=request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        deadline = time.monotonic() + self.deadline
+        hedge = self._hedge_pool is not None and request.url.path.endswith(HEDGED_PATHS)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise httpx.ReadTimeout("Истёк срок запроса", request=request)
+            response, error = None, None
+            try:
+                if hedge:
+                    response = self._hedged(request, remaining)
+                else:
+                    response = self._transport.handle_request(self._attempt_request(request, remaining))
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            attempt += 1
+            delay = backoff_delay(attempt, response)
+            if attempt > self.retries or time.monotonic() + delay >= deadline:
+                if response is not None:
+                    return response
+                raise error
+            HTTP_RETRIES_TOTAL.inc(reason=str(response.status_code) if response is not None else type(error).__name__)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+        self._transport.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Общий для процесса клиент: создаётся при первом вызове"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            limits = httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+            _client = httpx.Client(
+                transport=ResilientTransport(limits),
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                follow_redirects=True
+            )
+        return _client
@@ -0,0 +1,23 @@
+from config import RRF_K
+
+
+def _doc_key(doc):
+    # В корпусе позиции чанков повторяются между книгами
+    return doc.metadata.get("book"), doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings, k: int, rrf_k: int = RRF_K):
+    """Сливает несколько ранжированных списков документов (Reciprocal Rank Fusion).
+
+    Документ получает сумму 1 / (rrf_k + ранг) по всем спискам, где он встретился,
+    поэтому оценки BM25 и расстояния FAISS не нужно приводить к одной шкале.
+    """
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
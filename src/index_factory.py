@@ -0,0 +1,57 @@
+import math
+
+import faiss
+import numpy as np
+
+from config import INDEX_TYPE, HNSW_M, HNSW_EF_SEARCH, IVF_NPROBE, PQ_SUBVECTORS
+
+# flat — точный поиск; hnsw — граф HNSW; ivfpq — инвертированные списки
+# с продуктовым квантованием; sq8/fp16 — скалярное квантование int8/float16
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "sq8", "fp16")
+
+
+def _pq_subvectors(dim: int) -> int:
+    # Число подвекторов PQ должно делить размерность
+    m = min(PQ_SUBVECTORS, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(index_type: str, dim: int, n: int) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    if index_type == "ivfpq":
+        # ~4·sqrt(n) списков, но не больше, чем позволяет обучающая выборка
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        # На небольшой книге 256 центроидов на подвектор не обучить — уменьшаем разрядность кода
+        nbits = max(4, min(8, int(math.log2(max(n // 39, 1)))))
+        return f"IVF{nlist},PQ{_pq_subvectors(dim)}x{nbits}"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "fp16":
+        return "SQfp16"
+    raise ValueError(f"Неизвестный тип индекса: {index_type}. Доступны: {', '.join(INDEX_TYPES)}")
+
+
+def configure_search(index):
+    """Выставляет параметры поиска, которые не зависят от данных"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+    return index
+
+
+def build_index(vectors, index_type: str = INDEX_TYPE):
+    """Строит индекс FAISS выбранного типа по матрице векторов"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index_type = index_type if index_type != "ivfpq" or n >= 256 else "flat"  # PQ нужно минимум 256 векторов
+    index = faiss.index_factory(dim, factory_string(index_type, dim, n))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return configure_search(index)
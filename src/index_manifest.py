@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(text: str, metadata=None) -> str:
+    """Хеш текста вместе с метаданными: чанк с другой главой или страницей — другой чанк"""
+    digest = hashlib.sha256(text.encode("utf-8"))
+    if metadata:
+        digest.update(json.dumps(metadata, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+def build_manifest(pdf_sha256, chunk_size, chunk_overlap, model, page_hashes, chunk_hashes, index_type="flat") -> dict:
+    return {
+        "version": MANIFEST_VERSION,
+        "pdf_sha256": pdf_sha256,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": model,
+        "index_type": index_type,
+        "pages": page_hashes,
+        "chunks": chunk_hashes,
+    }
+
+
+def load_manifest(index_path: str):
+    path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(index_path: str, manifest: dict):
+    # Манифест пишется последним и атомарно: он подтверждает целостность индекса
+    path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(manifest, pdf_sha256, chunk_size, chunk_overlap, model, index_type="flat") -> bool:
+    return (
+        manifest is not None
+        and manifest["pdf_sha256"] == pdf_sha256
+        and manifest["chunk_size"] == chunk_size
+        and manifest["chunk_overlap"] == chunk_overlap
+        and manifest["embedding_model"] == model
+        and manifest.get("index_type", "flat") == index_type
+    )
+
+
+def save_vectors(index_path: str, vectors):
+    # Новый файл подменяет старый через rename: отображённый в память старый файл остаётся валидным
+    path = os.path.join(index_path, VECTORS_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(path + ".tmp", path)
+
+
+def load_stored_vectors(index_path: str, manifest, model) -> dict:
+    """Возвращает {хеш чанка: вектор} из предыдущей сборки той же моделью"""
+    path = os.path.join(index_path, VECTORS_FILE)
+    if manifest is None or manifest["embedding_model"] != model or not os.path.exists(path):
+        return {}
+    vectors = np.load(path, mmap_mode="r")
+    if len(vectors) != len(manifest["chunks"]):
+        return {}
+    return {chunk_hash: vectors[i] for i, chunk_hash in enumerate(manifest["chunks"])}
@@ -0,0 +1,79 @@
+import heapq
+import math
+import re
+
+# BM25
+K1 = 1.5
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = {
+    "а", "без", "был", "была", "были", "было", "быть", "в", "во", "вот", "все", "всё", "где", "да", "для",
+    "до", "его", "ее", "её", "ей", "ему", "если", "есть", "же", "за", "зачем", "и", "из", "или", "им", "их",
+    "к", "как", "какая", "какие", "какое", "каким", "какой", "каков", "какова", "каковы", "когда", "кто",
+    "ли", "между", "мне", "можно", "мы", "на", "над", "нам", "не", "него", "нее", "неё", "нет", "ни", "них",
+    "но", "о", "об", "он", "она", "они", "оно", "от", "по", "под", "почему", "при", "про", "с", "со",
+    "так", "также", "такое", "такой", "такая", "такие", "там", "то", "том", "тот", "ты", "у", "уже",
+    "чем", "чём", "что", "чтобы", "это", "этот", "эта", "эти", "я", "расскажи", "расскажите", "объясни",
+    "объясните", "скажи", "говорил", "говорили", "говорит", "считал", "считали", "значит",
+}
+
+# Окончания русских слов, от длинных к коротким: грубый стемминг без внешних зависимостей
+_ENDINGS = sorted([
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "иям", "иях",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ой", "ей", "ий", "ый", "ом", "ем", "ам", "ям", "ах", "ях",
+    "ию", "ия", "ии", "ью", "ов", "ев", "ую", "юю",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+_MIN_STEM = 4
+
+
+def stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str):
+    """Нормализованные термы: нижний регистр, ё -> е, без стоп-слов, со срезанными окончаниями.
+
+    «Анаксимандра» и «Анаксимандр» дают один терм, как и «атараксия»/«атараксии».
+    """
+    text = text.lower().replace("ё", "е")
+    return [stem(token) for token in _TOKEN_RE.findall(text) if token not in STOPWORDS and not token.isdigit()]
+
+
+def matched_terms(query: str, text: str) -> int:
+    """Сколько разных термов вопроса встречается в тексте"""
+    return len(set(tokenize(query)) & set(tokenize(text)))
+
+
+def bm25_search(query: str, postings_for_term, n_docs: int, avg_length: float, limit: int, allowed=None):
+    """Ранжирует чанки по BM25.
+
+    postings_for_term(term) возвращает [(позиция, tf, длина чанка)].
+    Оценка нормирована на максимально возможную для запроса, поэтому
+    лежит в [0, 1) и сравнима между запросами и книгами.
+    Возвращает [(позиция, оценка)] по убыванию оценки.
+    """
+    terms = set(tokenize(query))
+    if not terms or not n_docs:
+        return []
+    scores = {}
+    max_score = 0.0
+    for term in terms:
+        postings = postings_for_term(term)
+        df = len(postings)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        max_score += idf * (K1 + 1)
+        for position, tf, length in postings:
+            if allowed is not None and position not in allowed:
+                continue
+            norm = tf + K1 * (1 - B + B * length / avg_length)
+            scores[position] = scores.get(position, 0.0) + idf * tf * (K1 + 1) / norm
+    if not max_score:
+        return []
+    best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    return [(position, score / max_score) for position, score in best]
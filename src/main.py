@@ -1,20 +1,68 @@
-from config import MODEL_NAME
-from document_processor import DocumentProcessor
-from rag_system import RAGSystem
-from bot import RAGBot
+import time
+
+_started = time.perf_counter()
+
+from config import (
+    MODEL_NAME, BOT_MODE, CORPUS_MODE, DOCS_DIR, METRICS_PORT, WEBHOOK_PORT, BACKGROUND_LOAD, WARMUP_QUERY,
+    ADMISSION_CONTROL
+)
+from metrics import start_metrics_server
+from startup import BackgroundRAG, startup_phase
+
+
+def build_rag_system():
+    # langchain и FAISS импортируются только здесь: в фоновом режиме бот уже принимает сообщения
+    with startup_phase("imports"):
+        from document_processor import DocumentProcessor
+        from rag_system import RAGSystem
+        from answer_cache import index_fingerprint
+        from corpus import Corpus
+        from chapter_search import ChapterFilteredStore
+
+    with startup_phase("index_load"):
+        # Инициализация RAG системы
+        rag_system = RAGSystem(MODEL_NAME)
+        if CORPUS_MODE:
+            # Все книги из DOCS_DIR, по индексу на книгу
+            vectorstore = Corpus.from_directory(DOCS_DIR, rag_system.embeddings)
+            fingerprint = vectorstore.fingerprint()
+        else:
+            pdf_file = 'docs/История философии.pdf'
+            vectorstore = ChapterFilteredStore(DocumentProcessor.process_pdf(pdf_file, rag_system.embeddings))
+            fingerprint = index_fingerprint(DocumentProcessor.embeddings_path(pdf_file))
+
+        # Создание и инициализация RAG системы
+        rag_system.initialize_from_docs(vectorstore, index_fingerprint=fingerprint)
+    return rag_system
+
 
 def main():
-    # Инициализация RAG системы
-    pdf_file = 'docs/История философии.pdf'
-    rag_system = RAGSystem(MODEL_NAME)
-    vectorstore = DocumentProcessor.process_pdf(pdf_file, rag_system.embeddings)
-    
-    # Создание и инициализация RAG системы
-    rag_system.initialize_from_docs(vectorstore)
-    
+    # В режиме webhook на том же порту /metrics отдаёт сервер вебхука
+    if METRICS_PORT and not (BOT_MODE == "webhook" and METRICS_PORT == WEBHOOK_PORT):
+        start_metrics_server(METRICS_PORT)
+
+    if BACKGROUND_LOAD:
+        # До окончания загрузки бот отвечает, что запускается
+        rag_system = BackgroundRAG(build_rag_system, WARMUP_QUERY, started=_started).start()
+    else:
+        rag_system = build_rag_system()
+
+    with startup_phase("bot_imports"):
+        from bot import RAGBot, AsyncRAGBot
+        from admission import AdmissionController
+
+    # Лимиты на чат и общая очередь перед RAG
+    admission = AdmissionController() if ADMISSION_CONTROL else None
+
     # Запуск бота
-    bot = RAGBot(rag_system)
+    if BOT_MODE == "webhook":
+        from webhook import WebhookServer
+        bot = WebhookServer(AsyncRAGBot(rag_system, admission=admission))
+    elif BOT_MODE == "async":
+        bot = AsyncRAGBot(rag_system, admission=admission)
+    else:
+        bot = RAGBot(rag_system, admission=admission)
     bot.start()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
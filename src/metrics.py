@@ -0,0 +1,233 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Счётчики и гистограммы живут в процессе, span() замеряет стадию
+обработки вопроса, start_metrics_server() отдаёт всё на /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_PORT
+
+# Границы корзин гистограммы задержек, секунд
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def total(self) -> float:
+        """Сумма по всем значениям меток"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение: глубина очереди, длительность фаз старта"""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # ключ меток -> [счётчики корзин (последняя — +Inf), сумма, количество]
+        self._series = {}
+        # Сырые значения нужны только нагрузочному тесту для точных перцентилей
+        self.keep_samples = False
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+            if self.keep_samples:
+                self._samples.setdefault(key, []).append(value)
+
+    def samples(self) -> dict:
+        """{значения меток: [наблюдения]} с момента включения keep_samples"""
+        with self._lock:
+            return {key: list(values) for key, values in self._samples.items()}
+
+    def reset_samples(self):
+        with self._lock:
+            self._samples = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [le])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_seconds", "Длительность стадий обработки вопроса", ["stage"]
+))
+ERRORS = REGISTRY.register(Counter("rag_errors_total", "Ошибки по стадиям", ["stage"]))
+REQUESTS = REGISTRY.register(Counter(
+    "rag_requests_total", "Вопросы по пути ответа: lexical, hybrid, cached, coalesced", ["path"]
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter("rag_answer_cache_lookups_total", "Обращения к кешу ответов", ["result"]))
+PROMPT_TOKENS = REGISTRY.register(Counter("rag_prompt_tokens_total", "Токены промпта по разделам", ["section"]))
+PROMPT_SIZE = REGISTRY.register(Histogram(
+    "rag_prompt_tokens", "Размер промпта одного запроса, токенов", buckets=TOKEN_BUCKETS
+))
+EMBEDDED_TEXTS = REGISTRY.register(Counter("rag_embedded_texts_total", "Тексты, отправленные в API эмбеддингов"))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "rag_startup_seconds", "Длительность фаз запуска: импорты, загрузка индекса, прогрев, готовность", ["phase"]
+))
+WEBHOOK_UPDATES = REGISTRY.register(Counter(
+    "rag_webhook_updates_total", "Обновления, пришедшие на вебхук: accepted, rejected (очередь полна), forbidden, invalid",
+    ["result"]
+))
+WEBHOOK_QUEUE_DEPTH = REGISTRY.register(Gauge("rag_webhook_queue_depth", "Обновления в очереди вебхука"))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge("rag_admission_queue_depth", "Вопросы, ждущие места в очереди допуска"))
+ADMISSION_ACTIVE = REGISTRY.register(Gauge("rag_admission_active", "Вопросы, обрабатываемые сейчас"))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "rag_admission_rejected_total", "Отклонённые вопросы: rate_limited, queue_full, wait_timeout", ["reason"]
+))
+HTTP_RETRIES_TOTAL = REGISTRY.register(Counter(
+    "rag_http_retries_total", "Повторы запросов к API моделей по причине: код ответа или ошибка сети", ["reason"]
+))
+HTTP_HEDGES = REGISTRY.register(Counter(
+    "rag_http_hedges_total", "Дублирующие запросы эмбеддингов: sent — отправлен, won — ответил первым", ["result"]
+))
+
+
+@contextmanager
+def span(stage: str):
+    """Замеряет стадию: длительность в rag_stage_seconds, исключение — в rag_errors_total"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_prompt_tokens(tokens: dict):
+    for section, count in tokens.items():
+        if section != "total":
+            PROMPT_TOKENS.inc(count, section=section)
+    PROMPT_SIZE.observe(tokens["total"])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """Поднимает /metrics в фоновом потоке и возвращает сервер"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,62 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+from config import PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+
+
+def page_count(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pages(file_path: str, start: int = 0, stop: int = None):
+    """Лениво извлекает текст страниц [start, stop) по одной.
+
+    Извлечение совпадает с PyPDFLoader в режиме по страницам:
+    metadata["page"] — номер страницы с нуля.
+    """
+    reader = PdfReader(file_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text()
+        yield Document(page_content=text.strip(), metadata={"page": page_number})
+
+
+def _extract_range(file_path: str, start: int, stop: int, prepare=None):
+    """Задача для пула процессов: извлекает и готовит страницы [start, stop)"""
+    pages = iter_pages(file_path, start, stop)
+    if prepare is not None:
+        pages = (prepare(page) for page in pages)
+    return list(pages)
+
+
+def iter_pages_parallel(file_path: str, prepare=None, workers: int = PDF_EXTRACT_WORKERS,
+                        pages_per_task: int = PDF_PAGES_PER_TASK):
+    """Извлекает страницы диапазонами в пуле процессов.
+
+    Страницы отдаются строго по порядку и совпадают с результатом
+    iter_pages (с тем же prepare). В работе не больше 2 * workers
+    диапазонов, чтобы чтение оставалось потоковым.
+    """
+    total = page_count(file_path)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start, stop in ranges:
+            pending.append(executor.submit(_extract_range, file_path, start, stop, prepare))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_prepared_pages(file_path: str, prepare=None, workers: int = PDF_EXTRACT_WORKERS):
+    """Выбирает последовательное или параллельное извлечение по числу процессов и размеру книги"""
+    if workers > 1 and page_count(file_path) > 2 * PDF_PAGES_PER_TASK:
+        return iter_pages_parallel(file_path, prepare, workers)
+    pages = iter_pages(file_path)
+    if prepare is None:
+        return pages
+    return (prepare(page) for page in pages)
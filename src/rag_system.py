@@ -1,32 +1,50 @@
+import os
+import textwrap
+import time
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain.memory import ConversationBufferWindowMemory  # new import
+from langchain_core.output_parsers import StrOutputParser
+from session_store import create_session_store
+from backends import create_embeddings, create_llm
+from context_builder import ContextBuilder, count_tokens
+from metrics import span, record_prompt_tokens, REQUESTS, CACHE_LOOKUPS, STAGE_SECONDS, EMBEDDED_TEXTS
+from answer_cache import SemanticAnswerCache
+from books import detect_chapters
+from chapter_search import ChapterFilteredStore
+from hybrid_search import reciprocal_rank_fusion
+from lexical_index import matched_terms
+from reranking import maximal_marginal_relevance, merge_adjacent_chunks
+from single_flight import SingleFlight, flight_key
+from config import (
+    ANSWER_CACHE_ENABLED, CHAPTER_ROUTING, HYBRID_SEARCH, HYBRID_CANDIDATES, LEXICAL_FAST_PATH, LEXICAL_CONFIDENCE,
+    LEXICAL_MIN_TERMS, MMR_ENABLED, MMR_CANDIDATES, MMR_LAMBDA, COALESCE_REQUESTS, COALESCE_BY_HISTORY
+)
 
 class RAGSystem:
-    def __init__(self, model_name: str):
-        self.llm = ChatOpenAI(temperature=0, model_name=model_name, base_url="https://api.proxyapi.ru/openai/v1")
-        self.embeddings = OpenAIEmbeddings(base_url="https://api.proxyapi.ru/openai/v1")
-        self.memory = ConversationBufferWindowMemory(k=2)  # optimized memory from LangChain
+    def __init__(self, model_name: str, session_store=None, llm=None, embeddings=None):
+        # Модели выбираются LLM_BACKEND и EMBEDDING_BACKEND, если не переданы явно
+        self.llm = llm or create_llm(model_name)
+        self.embeddings = embeddings or create_embeddings()
+        # История хранится отдельно для каждого чата
+        self.sessions = session_store or create_session_store()
+        # Одинаковые вопросы, которые обрабатываются прямо сейчас
+        self.in_flight = SingleFlight()
         
-    def initialize_from_docs(self, documents):
-        self.db = documents  # теперь documents это уже готовое векторное хранилище
-        self.retriever = self.db.as_retriever(search_kwargs={"k": 3})  # Увеличиваем до 3 документов
+    def initialize_from_docs(self, documents, index_fingerprint=None):
+        # documents — готовое векторное хранилище FAISS или корпус книг (Corpus).
+        # Голый FAISS молча принимает chapters= в **kwargs и ищет по всей книге,
+        # поэтому он оборачивается в ChapterFilteredStore
+        if isinstance(documents, FAISS):
+            documents = ChapterFilteredStore(documents)
+        self.db = documents
+        self.search_kwargs = {"k": 3}  # Увеличиваем до 3 документов
+        # Кеш ответов привязан к отпечатку индекса и сбрасывается при его пересборке
+        self.answer_cache = None
+        if ANSWER_CACHE_ENABLED and index_fingerprint:
+            self.answer_cache = SemanticAnswerCache(index_fingerprint)
         
-        # Определяем функцию для форматирования документов с информацией об источниках
-        def format_docs(docs):
-            formatted_docs = []
-            for doc in docs:
-                chapter = doc.metadata.get('chapter', 'Неизвестная глава')
-                page = doc.metadata.get('page', 'Неизвестная страница')
-                # Добавляем метаданные в начало каждого документа
-                formatted_text = f"[{chapter}, {page}]\n\n{doc.page_content}\n\n---\n"
-                formatted_docs.append(formatted_text)
-            return "\n".join(formatted_docs)
-        
-        prompt = ChatPromptTemplate.from_template('''
+        # Отступы шаблона убираются: в промпте это лишние токены
+        prompt = ChatPromptTemplate.from_template(textwrap.dedent('''
             Answer the user's question using only the provided context. 
             If the context does not contain enough information to answer the question, say: 
             "I cannot answer that question because the provided context does not contain relevant information."
@@ -57,50 +75,218 @@ class RAGSystem:
             Conversation History: {history}
             Context: {context}
             Question: {input}
-            Source Documents: {source_documents}
             Answer:
-        ''')
-        
-        document_chain = create_stuff_documents_chain(
-            llm=self.llm,
-            prompt=prompt
-        )
-        
-        # Используем базовую версию без дополнительных параметров
-        self.retrieval_chain = create_retrieval_chain(
-            self.retriever, 
-            document_chain
-        )
-    
-    def get_answer(self, question: str) -> str:
-        # Load conversation history from optimized memory
-        history = self.memory.load_memory_variables({}).get("history", "")
-        
-        # Получаем документы напрямую
-        docs = self.retriever.get_relevant_documents(question)
+        ''').strip())
         
-        # Форматируем документы вручную
+        # Цепочка генерации получает уже найденные документы: поиск выполняется
+        # один раз в get_answer, без повторного вызова ретривера
+        self.document_chain = prompt | self.llm | StrOutputParser()
+        # Инструкции одинаковы для всех запросов, их токены считаются один раз
+        instruction_tokens = count_tokens(prompt.format(input="", history="", context=""))
+        self.context_builder = ContextBuilder(self.format_docs, instruction_tokens)
+
+    @staticmethod
+    def format_docs(docs):
+        """Форматирует документы с информацией об источниках"""
         formatted_docs = []
         for doc in docs:
-            chapter = doc.metadata.get('chapter')
-            page = doc.metadata.get('page')
-            source_id = f"[{chapter}, {page}]"
-            formatted_text = f"ИСТОЧНИК: Глава: {chapter} | Страница: {page}\n\n{doc.page_content}\n\n---\n"
+            chapter = doc.metadata.get('chapter', 'Неизвестная глава')
+            page = doc.metadata.get('page', 'Неизвестная страница')
+            source = f"Глава: {chapter} | Страница: {page}"
+            if 'book' in doc.metadata:
+                source = f"Книга: {os.path.splitext(doc.metadata['book'])[0]} | {source}"
+            formatted_text = f"ИСТОЧНИК: {source}\n\n{doc.page_content}\n\n---\n"
             formatted_docs.append(formatted_text)
-        
-        formatted_context = "\n".join(formatted_docs)
-        
-        # Вызываем цепочку с отформатированным контекстом
-        response = self.retrieval_chain.invoke({
-            'input': question, 
-            'history': history,
-            'context': formatted_context,  # Передаем отформатированный контекст напрямую
-            'source_documents': formatted_docs  # Добавляем исходные документы
-        })
-        
-        answer = response.get('answer', 'Не удалось получить ответ от системы.')
-        
-        # Update memory with the interaction
-        self.memory.chat_memory.add_user_message(question)
-        self.memory.chat_memory.add_ai_message(answer)
-        return answer
\ No newline at end of file
+        return formatted_docs
+
+    def lexical_search(self, question: str, books=None, chapters=None):
+        """BM25 по чанкам: [(документ, нормированная оценка)].
+
+        Пустой список, если гибридный поиск выключен или хранилище не
+        поддерживает лексический поиск (тогда работает только векторный).
+        """
+        if not HYBRID_SEARCH or not hasattr(self.db, "lexical_search_with_score"):
+            return []
+        kwargs = {"books": books} if books else {}
+        with span("lexical_search"):
+            if chapters:
+                results = self.db.lexical_search_with_score(question, HYBRID_CANDIDATES, chapters=chapters, **kwargs)
+                if results:
+                    return results
+            return self.db.lexical_search_with_score(question, HYBRID_CANDIDATES, **kwargs)
+
+    def retrieve(self, question: str, query_vector=None, books=None, chapters=None, lexical=None):
+        """Один поиск по векторному хранилищу на вопрос.
+
+        books ограничивает поиск выбранными книгами корпуса, chapters —
+        главами. Если главы не заданы, они определяются по ключевым словам
+        вопроса (CHAPTER_ROUTING); когда в этих главах ничего не нашлось,
+        поиск повторяется по всей книге. Если есть результаты BM25
+        (lexical), векторные кандидаты сливаются с ними по RRF. Из пула
+        кандидатов k документов выбираются по MMR, соседние чанки одной
+        страницы склеиваются.
+        """
+        if query_vector is None:
+            with span("embed_query"):
+                query_vector = self.embeddings.embed_query(question)
+            EMBEDDED_TEXTS.inc()
+        if chapters is None and CHAPTER_ROUTING:
+            chapters = detect_chapters(question)
+        if lexical is None:
+            lexical = self.lexical_search(question, books, chapters)
+        k = self.search_kwargs["k"]
+        # С MMR сначала берётся пул кандидатов, из которого выбираются k непохожих
+        use_mmr = MMR_ENABLED and hasattr(self.db, "embeddings_for")
+        pool = max(k, MMR_CANDIDATES) if use_mmr else k
+        search_kwargs = dict(self.search_kwargs)
+        search_kwargs["k"] = max(pool, HYBRID_CANDIDATES) if lexical else pool
+        if books:
+            search_kwargs["books"] = books
+        docs = []
+        with span("vector_search"):
+            if chapters:
+                docs = self.db.similarity_search_by_vector(query_vector, chapters=chapters, **search_kwargs)
+            if not docs:
+                docs = self.db.similarity_search_by_vector(query_vector, **search_kwargs)
+        with span("rerank"):
+            if lexical:
+                docs = reciprocal_rank_fusion([docs, [doc for doc, _ in lexical]], pool)
+            vectors = self.db.embeddings_for(docs) if use_mmr and len(docs) > k else None
+            if vectors is not None:
+                selected = maximal_marginal_relevance(query_vector, vectors, k, MMR_LAMBDA)
+                docs = [docs[i] for i in selected]
+            # Соседние чанки одной страницы идут в промпт одним фрагментом
+            return merge_adjacent_chunks(docs[:k])
+
+    def warm_up(self, question: str):
+        """Прогрев без вызова модели: соединение с API, страницы индекса и счётчик токенов"""
+        docs = self.retrieve(question)
+        self.context_builder.build(question, docs, [])
+
+    def generate(self, question: str, docs, turns=(), on_token=None):
+        """Генерирует ответ по заранее найденным документам.
+
+        Контекст и история упаковываются в бюджет токенов. Возвращает ответ
+        и упаковку: попавшие в промпт документы и токены по разделам.
+        С on_token ответ модели читается потоком, и каждый фрагмент
+        передаётся в on_token по мере генерации.
+        """
+        with span("context_build"):
+            prompt = self.context_builder.build(question, docs, turns)
+        record_prompt_tokens(prompt["tokens"])
+        with span("llm"):
+            if on_token is None:
+                answer = self.document_chain.invoke(prompt["inputs"])
+            else:
+                started = time.perf_counter()
+                parts = []
+                for chunk in self.document_chain.stream(prompt["inputs"]):
+                    if not parts:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_first_token")
+                    parts.append(chunk)
+                    on_token(chunk)
+                answer = "".join(parts)
+        return answer or 'Не удалось получить ответ от системы.', prompt
+
+    def get_answer_with_sources(self, question: str, chat_id=None, books=None, chapters=None, on_token=None) -> dict:
+        """Возвращает ответ вместе с документами, на которых он основан.
+
+        Без chat_id вопрос обрабатывается без истории диалога.
+        books и chapters направляют вопрос только в указанные книги и главы.
+        Точный повтор самостоятельного вопроса отвечается из кеша до поиска.
+        При уверенном совпадении BM25 (LEXICAL_FAST_PATH) ответ строится по
+        лексическим результатам без эмбеддинга вопроса. prompt_tokens —
+        токены промпта по разделам (None для ответа из кеша). on_token
+        получает фрагменты ответа по мере генерации (ответ из кеша целиком
+        возвращается без вызовов on_token). Одинаковые одновременные
+        вопросы (COALESCE_REQUESTS) отвечаются одним вызовом модели,
+        coalesced отмечает ответ, полученный чужим запросом.
+        """
+        with span("request"):
+            turns = []
+            if chat_id is not None:
+                with span("history"):
+                    turns = self.sessions.get_history(chat_id)
+
+            if COALESCE_REQUESTS:
+                key = flight_key(question, books, chapters, turns if COALESCE_BY_HISTORY else None)
+                result, coalesced = self.in_flight.do(
+                    key, lambda emit: self._answer(question, turns, books, chapters, emit), on_token
+                )
+                if coalesced:
+                    REQUESTS.inc(path="coalesced")
+            else:
+                result, coalesced = self._answer(question, turns, books, chapters, on_token), False
+
+            if chat_id is not None:
+                with span("session_append"):
+                    self.sessions.append(chat_id, question, result['answer'])
+        return {**result, 'coalesced': coalesced}
+
+    def _answer(self, question: str, turns, books=None, chapters=None, on_token=None) -> dict:
+        # Кеш общий для всей полки, поэтому вопросы по выбранным книгам и главам идут мимо него.
+        # Вопрос с историей может быть уточнением («а что он говорил о душе?»): самостоятельный
+        # ответ из кеша к нему не подходит
+        use_cache = self.answer_cache is not None and not books and not chapters and not turns
+        if use_cache:
+            # Точный повтор вопроса находится до любого поиска и без эмбеддинга
+            with span("cache_lookup"):
+                answer = self.answer_cache.lookup_text(question)
+            if answer is not None:
+                CACHE_LOOKUPS.inc(result="exact_hit")
+                REQUESTS.inc(path="cached")
+                return {'answer': answer, 'source_documents': [], 'cached': True, 'prompt_tokens': None}
+
+        if chapters is None and CHAPTER_ROUTING:
+            routed_chapters = detect_chapters(question)
+        else:
+            routed_chapters = chapters
+        lexical = self.lexical_search(question, books, routed_chapters)
+        if self._lexical_fast_path(question, lexical):
+            # Уверенное совпадение по терминам: отвечаем без запроса к API эмбеддингов
+            REQUESTS.inc(path="lexical")
+            docs = merge_adjacent_chunks([doc for doc, _ in lexical[:self.search_kwargs["k"]]])
+            answer, prompt = self.generate(question, docs, turns, on_token)
+            if use_cache:
+                with span("cache_store"):
+                    self.answer_cache.store(question, None, answer)
+            return self._result(answer, prompt)
+
+        # Эмбеддинг вопроса считается один раз: для кеша и для поиска
+        with span("embed_query"):
+            query_vector = self.embeddings.embed_query(question)
+        EMBEDDED_TEXTS.inc()
+        if use_cache:
+            with span("cache_lookup"):
+                answer = self.answer_cache.lookup(query_vector)
+            CACHE_LOOKUPS.inc(result="hit" if answer is not None else "miss")
+            if answer is not None:
+                REQUESTS.inc(path="cached")
+                return {'answer': answer, 'source_documents': [], 'cached': True, 'prompt_tokens': None}
+        REQUESTS.inc(path="hybrid")
+        docs = self.retrieve(question, query_vector, books, routed_chapters, lexical)
+        answer, prompt = self.generate(question, docs, turns, on_token)
+        # В кеш попадают только самостоятельные вопросы, без опоры на историю
+        if use_cache:
+            with span("cache_store"):
+                self.answer_cache.store(question, query_vector, answer)
+        return self._result(answer, prompt)
+
+    @staticmethod
+    def _lexical_fast_path(question: str, lexical) -> bool:
+        if not LEXICAL_FAST_PATH or not lexical or lexical[0][1] < LEXICAL_CONFIDENCE:
+            return False
+        # Однотермовый вопрос набирает высокую нормированную оценку почти в любом чанке с этим словом
+        return matched_terms(question, lexical[0][0].page_content) >= LEXICAL_MIN_TERMS
+
+    @staticmethod
+    def _result(answer: str, prompt) -> dict:
+        return {
+            'answer': answer,
+            'source_documents': prompt["documents"],
+            'cached': False,
+            'prompt_tokens': prompt["tokens"],
+        }
+
+    def get_answer(self, question: str, chat_id=None, books=None, chapters=None, on_token=None) -> str:
+        return self.get_answer_with_sources(question, chat_id, books, chapters, on_token)['answer']
@@ -0,0 +1,80 @@
+import numpy as np
+
+from config import CHUNK_OVERLAP
+
+
+def maximal_marginal_relevance(query_vector, vectors, k: int, lambda_mult: float):
+    """Индексы k кандидатов по MMR: близость к вопросу минус сходство с уже выбранными.
+
+    Все косинусные близости считаются одним матричным произведением,
+    поэтому каждый шаг выбора — операции над векторами длины n.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def _overlap(left: str, right: str) -> int:
+    """Длина общего куска конца left и начала right (перекрытие сплиттера, по границе слов)"""
+    for n in range(min(len(left), len(right), 2 * CHUNK_OVERLAP), 0, -1):
+        if not left.endswith(right[:n]):
+            continue
+        if (n == len(right) or right[n] == " ") and (n == len(left) or left[-n - 1] == " "):
+            return n
+    return 0
+
+
+def _position(doc):
+    try:
+        return int(doc.id)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_adjacent_chunks(docs):
+    """Склеивает соседние чанки одной страницы в один фрагмент без повтора перекрытия.
+
+    Соседние — идущие подряд в индексе. Фрагменты идут в порядке лучшего
+    из склеенных чанков.
+    """
+    # (книга, страница) -> [(позиция, ранг, документ)]
+    pages = {}
+    passages = []
+    for rank, doc in enumerate(docs):
+        position = _position(doc)
+        if position is None:
+            passages.append((rank, doc))
+            continue
+        pages.setdefault((doc.metadata.get("book"), doc.metadata.get("page")), []).append((position, rank, doc))
+
+    for chunks in pages.values():
+        chunks.sort(key=lambda item: item[0])
+        run = [chunks[0]]
+        for chunk in chunks[1:] + [None]:
+            if chunk is not None and chunk[0] == run[-1][0] + 1:
+                run.append(chunk)
+                continue
+            text = run[0][2].page_content
+            for _, _, doc in run[1:]:
+                text += doc.page_content[_overlap(text, doc.page_content):]
+            passage = run[0][2].model_copy(update={"page_content": text, "metadata": dict(run[0][2].metadata)})
+            passages.append((min(rank for _, rank, _ in run), passage))
+            run = [chunk]
+
+    passages.sort(key=lambda item: item[0])
+    return [passage for _, passage in passages]
@@ -0,0 +1,149 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX_CHATS, SESSION_TTL, HISTORY_WINDOW
+
+
+def format_history(turns) -> str:
+    """Форматирует историю так же, как ConversationBufferWindowMemory"""
+    lines = []
+    for question, answer in turns:
+        lines.append(f"Human: {question}")
+        lines.append(f"AI: {answer}")
+    return "\n".join(lines)
+
+
+class SessionStore:
+    """История диалогов по chat_id в памяти процесса.
+
+    Хранит не больше max_chats чатов (вытесняется давно неактивный),
+    сессии без обращений дольше ttl секунд удаляются. Для каждого чата
+    держится только последние window пар вопрос-ответ.
+    """
+
+    def __init__(self, max_chats: int = SESSION_MAX_CHATS, ttl: float = SESSION_TTL, window: int = HISTORY_WINDOW):
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self.window = window
+        # chat_id -> (время последнего обращения, кортеж пар вопрос-ответ)
+        self._sessions = OrderedDict()
+        # Блокировка держится только на время операций со словарём,
+        # сами истории неизменяемые и не разделяются между чатами
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        while self._sessions:
+            chat_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            del self._sessions[chat_id]
+
+    def get_history(self, chat_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(chat_id)
+            if session is None:
+                return []
+            self._sessions[chat_id] = (now, session[1])
+            self._sessions.move_to_end(chat_id)
+            return list(session[1])
+
+    def append(self, chat_id, question: str, answer: str):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            _, turns = self._sessions.pop(chat_id, (now, ()))
+            turns = (turns + ((question, answer),))[-self.window:]
+            self._sessions[chat_id] = (now, turns)
+            while len(self._sessions) > self.max_chats:
+                self._sessions.popitem(last=False)
+
+    def clear(self, chat_id):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """История диалогов в SQLite: переживает перезапуск бота.
+
+    Правила вытеснения те же, что у SessionStore.
+    """
+
+    def __init__(self, db_path: str = SESSION_DB_PATH, max_chats: int = SESSION_MAX_CHATS,
+                 ttl: float = SESSION_TTL, window: int = HISTORY_WINDOW):
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self.window = window
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "chat_id TEXT PRIMARY KEY, turns TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions(last_access)")
+        self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if count <= self.max_chats:
+            return
+        self._conn.execute(
+            "DELETE FROM sessions WHERE chat_id NOT IN "
+            "(SELECT chat_id FROM sessions ORDER BY last_access DESC LIMIT ?)",
+            (self.max_chats,)
+        )
+
+    def get_history(self, chat_id):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, last_access FROM sessions WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return []
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE chat_id = ?", (now, str(chat_id)))
+            self._conn.commit()
+            return [tuple(turn) for turn in json.loads(row[0])]
+
+    def append(self, chat_id, question: str, answer: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, last_access FROM sessions WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+            turns = json.loads(row[0]) if row and now - row[1] <= self.ttl else []
+            turns = (turns + [[question, answer]])[-self.window:]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (chat_id, turns, last_access) VALUES (?, ?, ?)",
+                (str(chat_id), json.dumps(turns, ensure_ascii=False), now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE chat_id = ?", (str(chat_id),))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    """Создаёт хранилище истории по имени бэкенда: memory или sqlite"""
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return SessionStore()
+    raise ValueError(f"Неизвестный бэкенд хранилища сессий: {backend}")
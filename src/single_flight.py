@@ -0,0 +1,112 @@
+"""Объединение одинаковых одновременных запросов (single-flight).
+
+Если вопрос уже обрабатывается, повторный такой же вопрос не запускает
+новый поиск и вызов модели, а ждёт результата первого. Фрагменты
+потокового ответа пересылаются всем ожидающим: и тем, кто пришёл в
+начале генерации, и тем, кто подключился позже (они сначала получают
+уже сгенерированное). После завершения запись удаляется — дальше
+повторы обслуживает кеш ответов.
+"""
+import hashlib
+import json
+import re
+import threading
+
+_PUNCTUATION = re.compile(r"[\s?!.,;:…«»\"'()-]+")
+
+
+def normalize_question(question: str) -> str:
+    """Регистр, пробелы и знаки препинания не различают вопросы"""
+    return _PUNCTUATION.sub(" ", question.lower().replace("ё", "е")).strip()
+
+
+def flight_key(question: str, books=None, chapters=None, turns=None) -> str:
+    """Ключ запроса: нормализованный вопрос, фильтры и, если передана, история диалога"""
+    payload = [
+        normalize_question(question),
+        sorted(books) if books else None,
+        sorted(chapters) if chapters else None,
+        [list(turn) for turn in turns] if turns is not None else None,
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.parts = []
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def emit(self, part: str):
+        with self.condition:
+            self.parts.append(part)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result, self.error, self.done = result, error, True
+            self.condition.notify_all()
+
+    def wait(self, on_token=None):
+        sent = 0
+        while True:
+            with self.condition:
+                while not self.done and len(self.parts) == sent:
+                    self.condition.wait()
+                new_parts = self.parts[sent:]
+                done = self.done
+            # on_token вызывается без блокировки: медленный получатель не задерживает генерацию
+            if on_token is not None:
+                for part in new_parts:
+                    on_token(part)
+            sent += len(new_parts)
+            if done and sent == len(self.parts):
+                break
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Выполняет fn один раз на ключ среди одновременных вызовов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key: str, fn, on_token=None):
+        """Возвращает (результат fn, был ли он получен чужим вызовом).
+
+        fn вызывается с функцией emit (или None без on_token у первого
+        вызова): каждый фрагмент, переданный в emit, получат on_token всех
+        ожидающих. Исключение fn пробрасывается каждому из них.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            return flight.wait(on_token), True
+
+        def emit(part):
+            flight.emit(part)
+            on_token(part)
+
+        try:
+            result = fn(emit if on_token is not None else None)
+        except BaseException as e:
+            with self._lock:
+                del self._flights[key]
+            flight.finish(error=e)
+            raise
+        with self._lock:
+            del self._flights[key]
+        flight.finish(result=result)
+        return result, False
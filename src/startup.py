@@ -0,0 +1,90 @@
+"""Быстрый старт бота: индекс загружается в фоновом потоке.
+
+Бот начинает принимать сообщения сразу, а BackgroundRAG до окончания
+загрузки отвечает NotReadyError — бот превращает её в сообщение
+«запускаюсь». После загрузки выполняется прогревочный запрос: эмбеддинг
+вопроса, поиск и упаковка контекста без вызова модели. Длительность
+каждой фазы печатается и попадает в метрику rag_startup_seconds.
+"""
+import _thread
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from config import WARMUP_QUERY
+from metrics import STARTUP_SECONDS
+
+
+class NotReadyError(RuntimeError):
+    """Индекс ещё загружается"""
+
+
+@contextmanager
+def startup_phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STARTUP_SECONDS.set(round(elapsed, 3), phase=phase)
+        print(f"Запуск: {phase} — {elapsed:.2f} с")
+
+
+class BackgroundRAG:
+    """RAGSystem, который собирается в фоновом потоке.
+
+    build — функция без аргументов, возвращающая готовый RAGSystem.
+    started — момент запуска процесса (time.perf_counter()), от него
+    считается фаза ready. Если загрузка упала, основной поток получает
+    KeyboardInterrupt и бот останавливается, как при обычном старте.
+    """
+
+    def __init__(self, build, warmup_query: str = WARMUP_QUERY, started: float = None):
+        self.build = build
+        self.warmup_query = warmup_query
+        self.started = started if started is not None else time.perf_counter()
+        self._rag_system = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._load, name="index-loader", daemon=True).start()
+        return self
+
+    def _load(self):
+        try:
+            rag_system = self.build()
+        except BaseException:
+            traceback.print_exc()
+            print("Не удалось загрузить индекс, бот останавливается")
+            _thread.interrupt_main()
+            return
+        if self.warmup_query:
+            with startup_phase("warmup"):
+                try:
+                    rag_system.warm_up(self.warmup_query)
+                except Exception as e:
+                    # Прогрев только ускоряет первые ответы, без него бот тоже работает
+                    print(f"Прогрев не удался: {e!r}")
+        self._rag_system = rag_system
+        self._ready.set()
+        elapsed = time.perf_counter() - self.started
+        STARTUP_SECONDS.set(round(elapsed, 3), phase="ready")
+        print(f"Запуск: готов к ответам через {elapsed:.2f} с после старта")
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _system(self):
+        if self._rag_system is None:
+            raise NotReadyError("Индекс ещё загружается")
+        return self._rag_system
+
+    def get_answer_with_sources(self, *args, **kwargs) -> dict:
+        return self._system().get_answer_with_sources(*args, **kwargs)
+
+    def get_answer(self, *args, **kwargs) -> str:
+        return self._system().get_answer(*args, **kwargs)
@@ -0,0 +1,117 @@
+"""Приём обновлений Telegram через вебхук.
+
+Асинхронный HTTP-сервер (aiohttp) на WEBHOOK_PORT принимает POST с
+обновлением, сразу отвечает 200 и кладёт обновление в очередь; его
+разбирают WEBHOOK_WORKERS обработчиков AsyncRAGBot. Если очередь
+заполнена, сервер отвечает 503 — Telegram повторит доставку позже.
+GET /healthz отвечает 200, когда индекс загружен, и 503 до этого.
+На том же сервере доступен /metrics, если METRICS_PORT совпадает с
+WEBHOOK_PORT.
+
+Для локальной проверки адрес Bot API меняется переменной
+TELEGRAM_API_URL (см. validation/webhook_test.py).
+"""
+import asyncio
+import time
+
+from aiohttp import web
+from telebot import types
+
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE,
+    METRICS_PORT
+)
+from metrics import REGISTRY, STAGE_SECONDS, WEBHOOK_UPDATES, WEBHOOK_QUEUE_DEPTH
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Вебхук для AsyncRAGBot: очередь обновлений и пул обработчиков"""
+
+    def __init__(self, rag_bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 url: str = WEBHOOK_URL, secret: str = WEBHOOK_SECRET, workers: int = WEBHOOK_WORKERS,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, serve_metrics: bool = METRICS_PORT == WEBHOOK_PORT):
+        self.rag_bot = rag_bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.url = url
+        self.secret = secret
+        self.workers = workers
+        self.queue_size = queue_size
+        self.serve_metrics = serve_metrics
+        self.queue = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.receive)
+        app.router.add_get("/healthz", self.health)
+        if self.serve_metrics:
+            app.router.add_get("/metrics", self.metrics)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def receive(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            WEBHOOK_UPDATES.inc(result="forbidden")
+            return web.Response(status=403)
+        try:
+            update = types.Update.de_json(await request.text())
+        except (ValueError, KeyError, TypeError):
+            WEBHOOK_UPDATES.inc(result="invalid")
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            WEBHOOK_UPDATES.inc(result="rejected")
+            return web.Response(status=503)
+        WEBHOOK_UPDATES.inc(result="accepted")
+        WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        # is_ready есть только у BackgroundRAG; обычный RAGSystem готов сразу
+        is_ready = getattr(self.rag_bot.rag_system, "is_ready", None)
+        if is_ready is not None and not is_ready():
+            return web.Response(status=503, text="warming up")
+        return web.Response(text="ok")
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    async def _worker(self):
+        while True:
+            received, update = await self.queue.get()
+            WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+            STAGE_SECONDS.observe(time.perf_counter() - received, stage="webhook_queue")
+            try:
+                await self.rag_bot.bot.process_new_updates([update])
+            except Exception as e:
+                print(f"Ошибка обработки обновления {update.update_id}: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    async def _on_startup(self, app):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        app["webhook_workers"] = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.url:
+            await self.rag_bot.bot.set_webhook(
+                url=self.url.rstrip("/") + self.path, secret_token=self.secret or None,
+                max_connections=min(100, self.workers)
+            )
+            print(f"Вебхук зарегистрирован: {self.url.rstrip('/')}{self.path}")
+
+    async def _on_cleanup(self, app):
+        for task in app["webhook_workers"]:
+            task.cancel()
+        await asyncio.gather(*app["webhook_workers"], return_exceptions=True)
+        await self.rag_bot.bot.close_session()
+
+    def start(self):
+        print(f"Бот принимает обновления на http://{self.host}:{self.port}{self.path}")
+        try:
+            web.run_app(self.create_app(), host=self.host, port=self.port, print=None)
+        finally:
+            self.rag_bot.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,121 @@
+"""Сравнение типов индекса FAISS: recall@k относительно точного поиска,
+задержка поиска p50/p99 и занимаемая память.
+
+Векторы берутся из vectors.npy построенного индекса книги, запросы —
+случайные векторы книги с небольшим шумом (API эмбеддингов не нужен).
+
+    python validation/index_benchmark.py --index embeddings/История\\ философии
+    python validation/index_benchmark.py --synthetic 50000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Добавляем src директорию (на одном уровне с validation) в путь для импорта
+src_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.append(src_path)
+
+from index_factory import INDEX_TYPES, build_index
+from index_manifest import VECTORS_FILE
+
+
+def resident_memory_bytes() -> int:
+    """Текущий RSS процесса (Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def load_vectors(args):
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        return rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+    path = os.path.join(args.index, VECTORS_FILE)
+    if not os.path.exists(path):
+        print(f"Ошибка: не найден файл {path}. Сначала постройте индекс (python src/main.py)")
+        sys.exit(1)
+    return np.load(path).astype(np.float32)
+
+
+def make_queries(vectors, n_queries, seed):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), n_queries)]
+    noise = rng.standard_normal(picked.shape).astype(np.float32) * picked.std() * 0.1
+    return np.ascontiguousarray(picked + noise)
+
+
+def benchmark(index_type, vectors, queries, exact_ids, k):
+    rss_before = resident_memory_bytes()
+    started = time.perf_counter()
+    index = build_index(vectors, index_type)
+    build_seconds = time.perf_counter() - started
+    rss_after = resident_memory_bytes()
+
+    # Задержка меряется по одному запросу, как в боте
+    latencies = []
+    found = np.empty_like(exact_ids)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found[i] = ids[0]
+
+    recall = np.mean([len(set(found[i]) & set(exact_ids[i])) / k for i in range(len(queries))])
+    return {
+        "index_type": index_type,
+        "index_class": type(index).__name__,
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "index_bytes": int(faiss.serialize_index(index).size),
+        "rss_delta_bytes": max(0, rss_after - rss_before),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк типов индекса FAISS")
+    parser.add_argument("--index", default=os.path.join("embeddings", "История философии"),
+                        help="Каталог индекса книги с vectors.npy")
+    parser.add_argument("--synthetic", type=int, default=0, help="Вместо книги взять N случайных векторов")
+    parser.add_argument("--dim", type=int, default=1536, help="Размерность синтетических векторов")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Типы индекса через запятую")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    queries = make_queries(vectors, args.queries, args.seed)
+    print(f"Векторов: {len(vectors)}, размерность: {vectors.shape[1]}, запросов: {len(queries)}, k={args.k}")
+
+    # Эталон — точный поиск
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, args.k)
+
+    results = []
+    print(f"\n{'тип':<8}{'recall@k':>10}{'p50, мс':>10}{'p99, мс':>10}{'индекс, МБ':>12}{'RSS, МБ':>10}")
+    for index_type in args.types.split(","):
+        result = benchmark(index_type.strip(), vectors, queries, exact_ids, args.k)
+        results.append(result)
+        print(f"{result['index_type']:<8}{result['recall_at_k']:>10.3f}{result['p50_ms']:>10.3f}"
+              f"{result['p99_ms']:>10.3f}{result['index_bytes'] / 2**20:>12.2f}{result['rss_delta_bytes'] / 2**20:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
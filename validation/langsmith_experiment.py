@@ -17,8 +17,10 @@ src_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__
 sys.path.append(src_path)
 
 # Импорт RAG системы
-from config import MODEL_NAME
+from config import MODEL_NAME, OPENAI_BASE_URL
+from http_transport import get_http_client
 from document_processor import DocumentProcessor
+from chapter_search import ChapterFilteredStore
 from rag_system import RAGSystem
 
 # Загрузка переменных окружения
@@ -36,7 +38,9 @@ if not os.environ["LANGSMITH_API_KEY"] or not os.environ["OPENAI_API_KEY"]:
 # Инициализация клиентов
 api_key = os.getenv("LANGSMITH_API_KEY", "")
 client = Client(api_key=api_key)
-openai_client = wrappers.wrap_openai(OpenAI(base_url="https://api.proxyapi.ru/openai/v1"))
+openai_client = wrappers.wrap_openai(
+    OpenAI(base_url=OPENAI_BASE_URL, http_client=get_http_client(), max_retries=0)
+)
 
 def load_evaluation_results(file_path):
     """Загрузка результатов оценки"""
@@ -124,7 +128,8 @@ def initialize_rag_system():
         print(f"Найден PDF файл: {pdf_file}")
     
     rag_system = RAGSystem(MODEL_NAME)
-    vectorstore = DocumentProcessor.process_pdf(pdf_file, rag_system.embeddings)
+    # Тот же конвейер, что в src/main.py: поиск по главам, гибридный поиск и MMR
+    vectorstore = ChapterFilteredStore(DocumentProcessor.process_pdf(pdf_file, rag_system.embeddings))
     rag_system.initialize_from_docs(vectorstore)
     return rag_system
 
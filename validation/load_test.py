@@ -0,0 +1,398 @@
+"""Нагрузочный тест: вопросы из evaluation_results.json прогоняются через
+RAGSystem или обработчик асинхронного бота с заданной параллельностью
+и интенсивностью потока.
+
+Отчёт: пропускная способность, p50/p95/p99 полного ответа и каждой
+стадии (из metrics.py), время до первого сообщения, память. Результат
+сохраняется в JSON, который можно сравнить с базовым прогоном другого
+коммита (--compare): при росте задержек сверх --max-regression код
+возврата ненулевой.
+
+    # Офлайн: локальные эмбеддинги и модель с задержками (см. src/backends.py)
+    python validation/load_test.py --offline --concurrency 8 --requests 200 --output baseline.json
+    # Открытая модель нагрузки: 5 вопросов в секунду, через обработчик бота
+    python validation/load_test.py --offline --target bot --rate 5 --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+src_path = os.path.join(ROOT, 'src')
+sys.path.append(src_path)
+
+DEFAULT_QUESTIONS = os.path.join(ROOT, "validation", "evaluation_results.json")
+# Сравниваемые при --compare показатели: путь в отчёте и направление (1 — больше хуже)
+COMPARED = [
+    (("latency", "p50"), 1),
+    (("latency", "p95"), 1),
+    (("latency", "p99"), 1),
+    (("throughput_rps",), -1),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест RAG-системы на вопросах оценки")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="JSON со списком {'query': ...}")
+    parser.add_argument("--target", choices=["rag", "bot"], default="rag",
+                        help="rag — RAGSystem.get_answer_with_sources, bot — AsyncRAGBot.handle_message")
+    parser.add_argument("--concurrency", type=int, default=4, help="Одновременных запросов (размер пула)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Вопросов в секунду (пуассоновский поток); 0 — закрытая модель, без пауз")
+    parser.add_argument("--requests", type=int, default=0, help="Всего запросов (по умолчанию — все вопросы один раз)")
+    parser.add_argument("--chats", type=int, default=0,
+                        help="Число чатов с историей; 0 — каждый вопрос без истории")
+    parser.add_argument("--stream", action="store_true", help="Потоковая генерация ответа")
+    parser.add_argument("--offline", action="store_true",
+                        help="Локальные бэкенды: EMBEDDING_BACKEND=hashing, LLM_BACKEND=fake")
+    parser.add_argument("--pdf", default=os.path.join(ROOT, "docs", "История философии.pdf"))
+    parser.add_argument("--warmup", type=int, default=2, help="Запросов до начала замеров")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Метка прогона в отчёте")
+    parser.add_argument("--output", help="Сохранить отчёт в JSON")
+    parser.add_argument("--compare", help="Базовый отчёт JSON для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Допустимое ухудшение относительно базового отчёта (доля)")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # Переменные нужно выставить до импорта config
+    if args.offline:
+        os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+        os.environ.setdefault("LLM_BACKEND", "fake")
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("TELEGRAM_TOKEN", "0:load-test")
+    # /metrics и кеш ответов исказили бы замер
+    os.environ["METRICS_PORT"] = "0"
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "0")
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    questions = [item["query"] if isinstance(item, dict) else str(item) for item in items]
+    if not questions:
+        print(f"Ошибка: в {path} нет вопросов")
+        sys.exit(1)
+    return questions
+
+
+def resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def peak_memory_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def build_rag_system(pdf):
+    from config import MODEL_NAME, CORPUS_MODE, DOCS_DIR
+    from rag_system import RAGSystem
+    from document_processor import DocumentProcessor
+    from chapter_search import ChapterFilteredStore
+    from corpus import Corpus
+
+    rag_system = RAGSystem(MODEL_NAME)
+    if CORPUS_MODE:
+        vectorstore = Corpus.from_directory(DOCS_DIR, rag_system.embeddings)
+    else:
+        if not os.path.exists(pdf):
+            print(f"Ошибка: не найден PDF {pdf}")
+            sys.exit(1)
+        vectorstore = ChapterFilteredStore(DocumentProcessor.process_pdf(pdf, rag_system.embeddings))
+    rag_system.initialize_from_docs(vectorstore)
+    return rag_system
+
+
+class FakeTelegram:
+    """Заменитель AsyncTeleBot: запоминает время первого и последнего сообщения каждого ответа.
+
+    Ответ определяется по message_id вопроса, правки — по id отправленного сообщения.
+    """
+
+    def __init__(self):
+        self.first_message = {}
+        self.last_message = {}
+        self._request_of_sent = {}
+        self._last_request_of_chat = {}
+        self._ids = 0
+
+    def _record(self, request, chat_id):
+        now = time.perf_counter()
+        self.first_message.setdefault(request, now)
+        self.last_message[request] = now
+        self._last_request_of_chat[chat_id] = request
+        self._ids += 1
+        self._request_of_sent[self._ids] = request
+        return types.SimpleNamespace(chat=types.SimpleNamespace(id=chat_id), message_id=self._ids)
+
+    async def reply_to(self, message, text, **kwargs):
+        return self._record(message.message_id, message.chat.id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return self._record(self._last_request_of_chat.get(chat_id), chat_id)
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return self._record(self._request_of_sent.get(message_id), chat_id)
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        return True
+
+    def pop(self, request):
+        return self.first_message.pop(request, None), self.last_message.pop(request, None)
+
+
+class Runner:
+    def __init__(self, args, rag_system):
+        self.args = args
+        self.rag_system = rag_system
+        self.executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="load-test")
+        self.bot = None
+        if args.target == "bot":
+            from bot import AsyncRAGBot
+            self.bot = AsyncRAGBot(rag_system, max_workers=args.concurrency, stream=args.stream)
+            self.bot.bot = FakeTelegram()
+        self.request_ids = 0
+
+    def _chat_id(self, i):
+        return i % self.args.chats if self.args.chats else None
+
+    async def run_one(self, question, i, arrived):
+        """Один вопрос; задержка считается от момента поступления, то есть с ожиданием в очереди"""
+        chat_id = self._chat_id(i)
+        first = None
+        if self.bot is not None:
+            self.request_ids += 1
+            message = types.SimpleNamespace(
+                chat=types.SimpleNamespace(id=chat_id if chat_id is not None else -self.request_ids),
+                text=question, message_id=self.request_ids
+            )
+            await self.bot.handle_message(message)
+            first, finished = self.bot.bot.pop(message.message_id)
+            finished = finished or time.perf_counter()
+            return {"latency": finished - arrived, "first": None if first is None else first - arrived}
+
+        loop = asyncio.get_running_loop()
+        on_token = None
+        if self.args.stream:
+            first_token = []
+            on_token = lambda chunk: first_token.append(time.perf_counter()) if not first_token else None
+        result = await loop.run_in_executor(
+            self.executor,
+            lambda: self.rag_system.get_answer_with_sources(question, chat_id, on_token=on_token)
+        )
+        finished = time.perf_counter()
+        if self.args.stream and first_token:
+            first = first_token[0] - arrived
+        return {"latency": finished - arrived, "first": first, "path": "cached" if result["cached"] else None}
+
+    async def closed_loop(self, questions):
+        queue = asyncio.Queue()
+        for i, question in enumerate(questions):
+            queue.put_nowait((i, question))
+        results = []
+
+        async def worker():
+            while not queue.empty():
+                i, question = queue.get_nowait()
+                results.append(await self._guarded(question, i, time.perf_counter()))
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return results
+
+    async def open_loop(self, questions):
+        rng = random.Random(self.args.seed)
+        tasks = []
+        for i, question in enumerate(questions):
+            tasks.append(asyncio.create_task(self._guarded(question, i, time.perf_counter())))
+            await asyncio.sleep(rng.expovariate(self.args.rate))
+        return await asyncio.gather(*tasks)
+
+    async def _guarded(self, question, i, arrived):
+        try:
+            return await self.run_one(question, i, arrived)
+        except Exception as e:
+            return {"latency": time.perf_counter() - arrived, "first": None, "error": repr(e)}
+
+    async def run(self, questions):
+        if self.args.rate > 0:
+            return await self.open_loop(questions)
+        return await self.closed_loop(questions)
+
+
+def stage_report(samples):
+    return {key[0]: percentiles(values) for key, values in sorted(samples.items())}
+
+
+def compare(report, baseline, max_regression):
+    """Печатает изменения относительно базового отчёта; True, если есть регрессия"""
+    print(f"\nСравнение с {baseline.get('meta', {}).get('commit') or 'базовым прогоном'}:")
+    # Сравнивать имеет смысл только прогоны с одинаковой нагрузкой и бэкендами
+    differs = [
+        key for key, value in report["meta"].items()
+        if key not in ("label", "commit", "timestamp") and baseline.get("meta", {}).get(key) != value
+    ]
+    if differs:
+        print(f"  ВНИМАНИЕ: условия прогонов различаются: {', '.join(differs)}")
+    regressed = False
+    for path, direction in COMPARED:
+        old, new = baseline, report
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        bad = change * direction > max_regression
+        regressed = regressed or bad
+        print(f"  {'.'.join(path):<16}{old:>10.4f} -> {new:>10.4f}  {change:+.1%}{'  РЕГРЕССИЯ' if bad else ''}")
+    for stage, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {}).get("p95")
+        if old and stats.get("p95") is not None:
+            change = (stats["p95"] - old) / old
+            # Разница меньше миллисекунды — шум, а не регрессия
+            if change > max_regression and stats["p95"] - old > 0.001:
+                print(f"  стадия {stage}: p95 {old:.4f} -> {stats['p95']:.4f} ({change:+.1%})")
+    return regressed
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    from config import EMBEDDING_BACKEND, LLM_BACKEND, INDEX_TYPE, HYBRID_SEARCH, MMR_ENABLED
+    import metrics
+
+    questions = load_questions(args.questions)
+    total = args.requests or len(questions)
+    rng = random.Random(args.seed)
+    schedule = [questions[i % len(questions)] for i in range(total)]
+    if args.requests:
+        rng.shuffle(schedule)
+
+    rss_before_init = resident_memory_bytes()
+    started = time.perf_counter()
+    rag_system = build_rag_system(args.pdf)
+    init_seconds = time.perf_counter() - started
+    runner = Runner(args, rag_system)
+
+    if args.warmup:
+        asyncio.run(runner.closed_loop(questions[:args.warmup]))
+    metrics.STAGE_SECONDS.keep_samples = True
+    metrics.STAGE_SECONDS.reset_samples()
+    errors_before = metrics.ERRORS.total()
+
+    print(f"Запросов: {total}, параллельность: {args.concurrency}, "
+          f"{'поток ' + str(args.rate) + '/с' if args.rate else 'закрытая модель'}, цель: {args.target}")
+    rss_before = resident_memory_bytes()
+    started = time.perf_counter()
+    results = asyncio.run(runner.run(schedule))
+    elapsed = time.perf_counter() - started
+    rss_after = resident_memory_bytes()
+
+    ok = [result for result in results if "error" not in result]
+    failed = [result for result in results if "error" in result]
+    first = [result["first"] for result in ok if result.get("first") is not None]
+    report = {
+        "meta": {
+            "label": args.label,
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "target": args.target,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "requests": total,
+            "chats": args.chats,
+            "stream": args.stream,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "llm_backend": LLM_BACKEND,
+            "index_type": INDEX_TYPE,
+            "hybrid_search": HYBRID_SEARCH,
+            "mmr": MMR_ENABLED,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "init_seconds": round(init_seconds, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "errors": len(failed),
+        "internal_errors": metrics.ERRORS.total() - errors_before,
+        "latency": percentiles([result["latency"] for result in ok]),
+        "first_response": percentiles(first),
+        "stages": stage_report(metrics.STAGE_SECONDS.samples()),
+        "memory": {
+            "rss_init_delta_bytes": max(0, rss_before - rss_before_init),
+            "rss_run_delta_bytes": max(0, rss_after - rss_before),
+            "rss_bytes": rss_after,
+            "peak_rss_bytes": max(peak_memory_bytes(), rss_after),
+        },
+    }
+
+    latency = report["latency"]
+    print(f"\nГотово за {elapsed:.2f} с: {report['throughput_rps']:.2f} запр/с, ошибок: {len(failed)}")
+    if latency["count"]:
+        print(f"Ответ целиком: p50 {latency['p50']:.3f} с, p95 {latency['p95']:.3f} с, p99 {latency['p99']:.3f} с")
+    if first:
+        first_stats = report["first_response"]
+        print(f"Первый фрагмент: p50 {first_stats['p50']:.3f} с, p95 {first_stats['p95']:.3f} с")
+    print(f"\n{'стадия':<18}{'n':>6}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<18}{stats['count']:>6}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}"
+              f"{stats['p99'] * 1000:>10.1f}")
+    print(f"\nRSS: {report['memory']['rss_bytes'] / 2**20:.1f} МБ, пик {report['memory']['peak_rss_bytes'] / 2**20:.1f} МБ")
+    if failed:
+        print(f"Пример ошибки: {failed[0]['error']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
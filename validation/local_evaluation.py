@@ -0,0 +1,248 @@
+"""Локальная оценка качества без LangSmith.
+
+Вопросы из evaluation_results.json обрабатываются параллельно (с
+ограничением --concurrency), каждый пример — отдельным запросом без
+истории и без кеша ответов. Точность, полезность и фактичность
+оцениваются одним структурированным вызовом модели-оценщика. Оценки
+кешируются в SQLite по хешу вопроса, ответа и эталона, поэтому
+повторный прогон переоценивает только изменившиеся ответы.
+
+    python validation/local_evaluation.py --concurrency 8 --output validation/local_results.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+src_path = os.path.join(ROOT, 'src')
+sys.path.append(src_path)
+
+load_dotenv()
+
+DEFAULT_QUESTIONS = os.path.join(ROOT, "validation", "evaluation_results.json")
+DEFAULT_GRADE_CACHE = os.path.join(ROOT, "validation", "grade_cache.sqlite")
+GRADER_MODEL = "gpt-4o-mini"
+# Меняется вместе с инструкциями оценщика: старые оценки тогда не используются
+GRADER_VERSION = 1
+METRICS = ("accuracy", "helpfulness", "groundedness")
+
+GRADER_INSTRUCTIONS = """
+Оцените ответ системы на вопрос пользователя по трём критериям, каждый по шкале от 0 до 1.
+
+accuracy — точность по сравнению с эталонным ответом:
+- 1.0: Полное соответствие всех ключевых концепций и фактов
+- 0.8: Большинство ключевых концепций правильны, есть незначительные неточности
+- 0.6: Частичное соответствие с некоторыми пропусками или ошибками
+- 0.4: Базовое понимание, но существенные пропуски
+- 0.2: Минимальное соответствие
+- 0.0: Полное несоответствие или неверная информация
+Оценивайте СОДЕРЖАНИЕ, а не точное соответствие слов.
+
+helpfulness — полезность ответа для вопроса пользователя:
+- 1.0: Исключительно полезный, полный и хорошо структурированный ответ
+- 0.8: Очень полезный ответ с хорошей структурой
+- 0.6: Достаточно полезный ответ, но могло быть лучше
+- 0.4: Минимально полезный ответ с существенными недостатками
+- 0.2: Очень мало полезной информации
+- 0.0: Бесполезный ответ
+Учитывайте формат, структуру, ясность и полноту ответа.
+
+groundedness — фактичность (отсутствие "галлюцинаций"):
+- 1.0: Идеально фактический ответ, полностью основан на достоверной информации
+- 0.8: В основном фактический, с незначительными неточностями
+- 0.6: Частично фактический, есть некоторые необоснованные утверждения
+- 0.4: Много необоснованных утверждений, но есть и фактическая информация
+- 0.2: В основном содержит "галлюцинации", мало фактов
+- 0.0: Полностью выдуманная информация, не соответствующая действительности
+"""
+
+
+class CombinedGrade(BaseModel):
+    accuracy: float = Field(description="Точность относительно эталонного ответа, от 0 до 1")
+    helpfulness: float = Field(description="Полезность ответа для пользователя, от 0 до 1")
+    groundedness: float = Field(description="Фактичность ответа, от 0 до 1")
+    reasoning: str = Field(description="Краткое объяснение оценок")
+
+
+def grade_key(question: str, answer: str, reference: str) -> str:
+    payload = json.dumps([GRADER_VERSION, GRADER_MODEL, question, answer, reference], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GradeCache:
+    """Оценки по хешу (вопрос, ответ, эталон) в SQLite, общий для потоков"""
+
+    def __init__(self, path: str = DEFAULT_GRADE_CACHE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS grades (key TEXT PRIMARY KEY, grade TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT grade FROM grades WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, grade: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grades (key, grade, created) VALUES (?, ?, ?)",
+                (key, json.dumps(grade, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class Grader:
+    """Один вызов модели на пример: три метрики сразу, со структурированным ответом"""
+
+    def __init__(self, cache: GradeCache):
+        from openai import OpenAI
+        from config import OPENAI_BASE_URL
+        from http_transport import get_http_client
+        # Тот же пул соединений и те же повторы, что у эмбеддингов и чата
+        self.client = OpenAI(base_url=OPENAI_BASE_URL, http_client=get_http_client(), max_retries=0)
+        self.cache = cache
+
+    def grade(self, question: str, answer: str, reference: str):
+        """Возвращает (оценка, взята ли из кеша)"""
+        key = grade_key(question, answer, reference)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        response = self.client.beta.chat.completions.parse(
+            model=GRADER_MODEL,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": GRADER_INSTRUCTIONS},
+                {"role": "user", "content": (
+                    f"Вопрос пользователя: {question}\n\n"
+                    f"Эталонный ответ: {reference}\n\n"
+                    f"Ответ системы: {answer}"
+                )},
+            ],
+            response_format=CombinedGrade
+        )
+        grade = response.choices[0].message.parsed.model_dump()
+        self.cache.put(key, grade)
+        return grade, False
+
+
+def load_examples(path):
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [{"query": item["query"], "reference": item.get("reference", "")} for item in items]
+
+
+def initialize_rag_system(pdf_file):
+    from config import MODEL_NAME
+    from document_processor import DocumentProcessor
+    from chapter_search import ChapterFilteredStore
+    from rag_system import RAGSystem
+
+    if not os.path.exists(pdf_file):
+        print(f"Ошибка: Не удалось найти PDF файл по пути {pdf_file}")
+        sys.exit(1)
+    rag_system = RAGSystem(MODEL_NAME)
+    vectorstore = ChapterFilteredStore(DocumentProcessor.process_pdf(pdf_file, rag_system.embeddings))
+    # Без отпечатка индекса кеш ответов не создаётся: каждый пример отвечается заново
+    rag_system.initialize_from_docs(vectorstore)
+    return rag_system
+
+
+def evaluate_example(rag_system, grader, example):
+    started = time.perf_counter()
+    # Без chat_id пример обрабатывается без истории: примеры не влияют друг на друга
+    result = rag_system.get_answer_with_sources(example["query"])
+    response_time = time.perf_counter() - started
+    record = {
+        "query": example["query"],
+        "reference": example["reference"],
+        "response": result["answer"],
+        "response_time": round(response_time, 3),
+        "prompt_tokens": (result.get("prompt_tokens") or {}).get("total"),
+    }
+    if grader is not None:
+        grade, cached = grader.grade(example["query"], result["answer"], example["reference"])
+        record.update({metric: grade[metric] for metric in METRICS})
+        record["reasoning"] = grade["reasoning"]
+        record["grade_cached"] = cached
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная параллельная оценка качества RAG")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--pdf", default=os.path.join(ROOT, "docs", "История философии.pdf"))
+    parser.add_argument("--concurrency", type=int, default=8, help="Примеров одновременно")
+    parser.add_argument("--grade-cache", default=DEFAULT_GRADE_CACHE, help="Файл кеша оценок")
+    parser.add_argument("--no-grade", action="store_true", help="Только получить ответы, без оценки")
+    parser.add_argument("--output", help="Сохранить ответы и оценки в JSON")
+    args = parser.parse_args()
+
+    if not os.getenv("OPENAI_API_KEY"):
+        print("Ошибка: Отсутствует OPENAI_API_KEY")
+        sys.exit(1)
+
+    examples = load_examples(args.questions)
+    print(f"Примеров: {len(examples)}, параллельно: {args.concurrency}")
+    rag_system = initialize_rag_system(args.pdf)
+    cache = None if args.no_grade else GradeCache(args.grade_cache)
+    grader = None if cache is None else Grader(cache)
+
+    started = time.perf_counter()
+    records = [None] * len(examples)
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="evaluation") as executor:
+        futures = [executor.submit(evaluate_example, rag_system, grader, example) for example in examples]
+        for i, future in enumerate(futures):
+            try:
+                records[i] = future.result()
+            except Exception as e:
+                failed += 1
+                records[i] = {"query": examples[i]["query"], "error": repr(e)}
+                print(f"Ошибка на примере «{examples[i]['query']}»: {e}")
+    elapsed = time.perf_counter() - started
+    if cache is not None:
+        cache.close()
+
+    graded = [record for record in records if "error" not in record and "accuracy" in record]
+    summary = {
+        "examples": len(examples),
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 2),
+        "graded": len(graded),
+        "regraded": sum(1 for record in graded if not record["grade_cached"]),
+    }
+    for metric in METRICS:
+        if graded:
+            summary[metric] = round(sum(record[metric] for record in graded) / len(graded), 4)
+
+    print(f"\nГотово за {elapsed:.1f} с, ошибок: {failed}")
+    if graded:
+        print(f"Оценено: {len(graded)}, из них заново: {summary['regraded']} (остальные — из кеша)")
+        for metric in METRICS:
+            print(f"  {metric:<13}{summary[metric]:.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": records}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Проверка режима webhook без Telegram.
+
+Скрипт поднимает локальный заменитель Bot API, отправляет на вебхук бота
+обновления с вопросами из evaluation_results.json (каждое — в свой чат)
+и ждёт окончательных ответов. Отчёт: подтверждение приёма (ответ
+вебхука), время до первого и до окончательного сообщения, пропускная
+способность.
+
+    # 1. Заменитель Bot API; скрипт ждёт, пока бот откроет вебхук
+    python validation/webhook_test.py --requests 200 --concurrency 32
+    # 2. В другом терминале — бот в режиме webhook с запросами к заменителю
+    BOT_MODE=webhook TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_TOKEN=0:test \\
+        EMBEDDING_BACKEND=hashing LLM_BACKEND=fake python src/main.py
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from load_test import DEFAULT_QUESTIONS, load_questions, percentiles
+
+# Так бот помечает недописанный потоковый ответ (DRAFT_SUFFIX в src/bot.py)
+DRAFT_SUFFIX = ' …'
+
+
+class FakeTelegram:
+    """Сообщения бота по чатам: время первого и окончательного"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first = {}
+        self.final = {}
+        self.calls = {}
+        self.next_message_id = 1
+        self.done = threading.Condition(self.lock)
+
+    def record(self, method: str, params: dict):
+        now = time.perf_counter()
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            chat_id = params.get("chat_id")
+            if method in ("sendMessage", "editMessageText") and chat_id is not None:
+                chat_id = int(chat_id)
+                self.first.setdefault(chat_id, now)
+                if not params.get("text", "").endswith(DRAFT_SUFFIX):
+                    self.final.setdefault(chat_id, now)
+                    self.done.notify_all()
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": int(params.get("message_id", message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "RAG", "username": "rag_test_bot"}
+        return True
+
+    def wait_final(self, chat_ids, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while not all(chat_id in self.final for chat_id in chat_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.done.wait(remaining)
+        return True
+
+
+def make_handler(telegram: FakeTelegram):
+    class BotApiHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            # /bot<токен>/<метод>
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params = json.loads(body or "{}")
+            else:
+                params = {key: values[0] for key, values in parse_qs(body).items()}
+            payload = json.dumps({"ok": True, "result": telegram.record(method, params)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST
+
+    return BotApiHandler
+
+
+def make_update(i: int, chat_id: int, text: str) -> bytes:
+    user = {"id": chat_id, "is_bot": False, "first_name": "Тест"}
+    return json.dumps({
+        "update_id": i,
+        "message": {
+            "message_id": i, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"}, "from": user,
+        },
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def post_update(url: str, body: bytes, secret: str):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, body, headers), timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return started, time.perf_counter() - started, status
+
+
+def wait_for_webhook(url: str, timeout: float) -> bool:
+    """Ждёт, пока бот загрузит индекс: /healthz на том же сервере отвечает 200"""
+    parts = urlsplit(url)
+    health_url = f"{parts.scheme}://{parts.netloc}/healthz"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(health_url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Доставка обновлений на вебхук бота через локальный Bot API")
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8000/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--telegram-host", default="127.0.0.1")
+    parser.add_argument("--telegram-port", type=int, default=8081, help="Порт заменителя Bot API")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--requests", type=int, default=0, help="Всего обновлений (по умолчанию — все вопросы)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Одновременных POST на вебхук")
+    parser.add_argument("--timeout", type=float, default=120, help="Сколько ждать всех ответов, секунд")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="Сколько ждать готовности бота, секунд")
+    parser.add_argument("--output", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    telegram = FakeTelegram()
+    server = ThreadingHTTPServer((args.telegram_host, args.telegram_port), make_handler(telegram))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Заменитель Bot API: http://{args.telegram_host}:{args.telegram_port}")
+
+    if not wait_for_webhook(args.webhook_url, args.startup_timeout):
+        print(f"Вебхук {args.webhook_url} не отвечает")
+        sys.exit(1)
+
+    questions = load_questions(args.questions)
+    total = args.requests or len(questions)
+    # Свой чат на каждое обновление: ответы не смешиваются, история не влияет
+    chat_ids = [1_000_000 + i for i in range(total)]
+    updates = [make_update(i + 1, chat_ids[i], questions[i % len(questions)]) for i in range(total)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        posted = list(executor.map(lambda body: post_update(args.webhook_url, body, args.secret), updates))
+    completed = telegram.wait_final(chat_ids, args.timeout)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    statuses = {}
+    for _, _, status in posted:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    first = [telegram.first[chat_id] - sent for chat_id, (sent, _, _) in zip(chat_ids, posted) if chat_id in telegram.first]
+    final = [telegram.final[chat_id] - sent for chat_id, (sent, _, _) in zip(chat_ids, posted) if chat_id in telegram.final]
+    report = {
+        "updates": total,
+        "answered": len(final),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(final) / elapsed, 3) if elapsed else 0,
+        "webhook_status": statuses,
+        "ack": percentiles([ack for _, ack, _ in posted]),
+        "first_message": percentiles(first),
+        "final_message": percentiles(final),
+        "bot_api_calls": telegram.calls,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if not completed:
+        print(f"Не дождались ответов: {total - len(final)} из {total}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()